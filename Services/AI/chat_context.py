@@ -0,0 +1,190 @@
+import math
+import hashlib
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def count_tokens(text: str) -> int:
+    """
+    Approximate the number of LM tokens in `text` (about four characters per token
+    for English with Llama/Mistral tokenizers). Good enough for budgeting; not exact.
+    """
+    return math.ceil(len(text) / 4) if text else 0
+
+
+def _prefix_key(covered_hash: str) -> str:
+    # Cache key of a summary stored by the messages it covers rather than a conversation id
+    return f"prefix:{covered_hash}"
+
+
+def _messages_hash(messages: List[str]) -> str:
+    digest = hashlib.sha256()
+    for message in messages:
+        digest.update(message.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+@dataclass
+class RollingSummary:
+    """
+    Summary of the first `covered` messages of a conversation.
+    `covered_hash` detects a history that was edited rather than appended to.
+    """
+    text: str
+    covered: int
+    covered_hash: str
+
+
+@dataclass
+class ChatContext:
+    """
+    What goes into the chat prompt: a summary of older turns and the recent turns verbatim.
+    """
+    summary: Optional[str]
+    recent: List[str]
+    stats: Dict[str, Any]
+
+
+class ChatContextManager:
+    """
+    Keeps the conversation history in a chat prompt within a token budget.
+
+    The most recent turns are kept verbatim as long as they fit in `history_budget` tokens.
+    Older turns are folded into a rolling summary, cached per conversation, which is only
+    extended with the turns that newly fall out of the budget. Without a conversation id the
+    summary is cached by the exact messages it covers, so it is only reused for a history
+    that starts with all of them. Each time it is extended,
+    enough turns are folded to bring the verbatim part down to `refold_ratio` of the budget,
+    so the summary is updated every few turns rather than on every request.
+
+    Args:
+    - summarize (Callable): `summarize(previous_summary, messages)` returns the new summary text.
+    - history_budget (int): Token budget for the verbatim recent turns.
+    - refold_ratio (float): Fraction of the budget left for verbatim turns after folding.
+    - max_conversations (int): Conversations whose summaries are cached (least recently used evicted).
+    """
+
+    def __init__(
+        self,
+        summarize: Callable[[Optional[str], List[str]], Awaitable[str]],
+        history_budget: int,
+        refold_ratio: float = 0.5,
+        max_conversations: int = 1024,
+    ):
+        self.summarize = summarize
+        self.history_budget = history_budget
+        self.refold_ratio = refold_ratio
+        self.max_conversations = max_conversations
+        self._summaries: "OrderedDict[str, RollingSummary]" = OrderedDict()
+        self.summary_updates = 0
+        self.summary_reuses = 0
+
+    def _fold_point(self, token_counts: List[int], budget: int) -> int:
+        """
+        Index of the first message kept verbatim when the newest messages get `budget` tokens.
+        """
+        used = 0
+        for index in range(len(token_counts) - 1, -1, -1):
+            used += token_counts[index]
+            if used > budget:
+                # Always keep the latest turn verbatim
+                return min(index + 1, len(token_counts) - 1)
+        return 0
+
+    def _cached(self, conversation_id: str, messages: List[str]) -> Optional[RollingSummary]:
+        summary = self._summaries.get(conversation_id)
+        if summary is None:
+            return None
+        if summary.covered > len(messages) or summary.covered_hash != _messages_hash(messages[:summary.covered]):
+            # The history does not extend the summarized one, start over
+            del self._summaries[conversation_id]
+            return None
+        self._summaries.move_to_end(conversation_id)
+        return summary
+
+    def _cached_by_prefix(self, messages: List[str]) -> Optional[RollingSummary]:
+        # The longest prefix of the history with a cached summary
+        digest = hashlib.sha256()
+        prefix_hashes = []
+        for message in messages:
+            digest.update(message.encode("utf-8"))
+            digest.update(b"\0")
+            prefix_hashes.append(digest.hexdigest())
+        for prefix_hash in reversed(prefix_hashes):
+            key = _prefix_key(prefix_hash)
+            summary = self._summaries.get(key)
+            if summary is not None:
+                self._summaries.move_to_end(key)
+                return summary
+        return None
+
+    def _store(self, conversation_id: str, summary: RollingSummary):
+        self._summaries[conversation_id] = summary
+        self._summaries.move_to_end(conversation_id)
+        while len(self._summaries) > self.max_conversations:
+            self._summaries.popitem(last=False)
+
+    async def build(self, conversation_id: Optional[str], messages: List[str]) -> ChatContext:
+        """
+        Split a conversation history into a summary and the recent turns for the prompt.
+
+        Args:
+        - conversation_id (str, optional): Identifies the conversation whose summary is cached;
+          without it, summaries are looked up by the messages they cover.
+        - messages (List[str]): The full history, oldest first.
+
+        Returns:
+        - ChatContext: The summary (or None), the verbatim turns and token counts.
+        """
+        token_counts = [count_tokens(message) for message in messages]
+        must_fold = self._fold_point(token_counts, self.history_budget)
+        if conversation_id:
+            summary = self._cached(conversation_id, messages)
+        else:
+            summary = self._cached_by_prefix(messages)
+        summary_updated = False
+
+        if must_fold > (summary.covered if summary else 0):
+            # Fold past the minimum so the next few turns fit without another summary update
+            fold = max(must_fold, self._fold_point(token_counts, int(self.history_budget * self.refold_ratio)))
+            start = summary.covered if summary else 0
+            try:
+                text = await self.summarize(summary.text if summary else None, messages[start:fold])
+                summary = RollingSummary(text.strip(), fold, _messages_hash(messages[:fold]))
+                self._store(conversation_id or _prefix_key(summary.covered_hash), summary)
+                self.summary_updates += 1
+                summary_updated = True
+            except Exception as exc:
+                # Keep the previous summary and respect the budget by dropping the unsummarized turns
+                logger.error(f"Summarizing conversation {conversation_id} failed: {exc}")
+                summary = RollingSummary(summary.text if summary else "", must_fold, "")
+        elif summary is not None:
+            self.summary_reuses += 1
+
+        covered = summary.covered if summary else 0
+        recent = messages[covered:]
+        summary_text = summary.text if summary and summary.text else None
+        return ChatContext(
+            summary=summary_text,
+            recent=recent,
+            stats={
+                "history_messages": len(messages),
+                "history_tokens": sum(token_counts),
+                "summarized_messages": covered,
+                "verbatim_tokens": sum(token_counts[covered:]),
+                "summary_tokens": count_tokens(summary_text or ""),
+                "summary_updated": summary_updated,
+            },
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "conversations": len(self._summaries),
+            "summary_updates": self.summary_updates,
+            "summary_reuses": self.summary_reuses,
+        }
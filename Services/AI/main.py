@@ -1,12 +1,90 @@
-from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-import http.client
+import os
+import sys
 import json
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
 from pydantic import BaseModel
-from typing import List
-
-app = FastAPI()
+from typing import AsyncIterator, Awaitable, Callable, List, Literal, Optional, Tuple
+from pathlib import Path
+
+# Shared modules live in Services/common
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common import metrics
+from common.lm_router import LMRouter
+
+from singleflight import SingleFlight, payload_key
+from scheduler import BACKGROUND, INTERACTIVE, PRIORITIES, LMScheduler
+from story_cache import StoryCache
+from chat_context import ChatContextManager, count_tokens
+from prompts import Messages, create_chat_prompt, create_story_prompt, create_summary_prompt, prompt_text
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Define server details (override with LM_HOST / LM_PORT, or list several servers in LM_ENDPOINTS)
+HOST = os.getenv("LM_HOST", "localhost")
+PORT = int(os.getenv("LM_PORT", 1234))  # Update this to match your LM Studio API port
+LM_MODEL = "amethyst-13b-mistral"
+LM_TIMEOUT = 120.0  # Seconds to wait for the LM server (per read when streaming)
+# Generations the LM servers run at once (their parallel/batch slots, summed over all servers);
+# more calls wait in the scheduler
+LM_CONCURRENCY = int(os.getenv("LM_CONCURRENCY", 2))
+# Background calls waiting longer than this are admitted ahead of interactive ones
+LM_BACKGROUND_MAX_WAIT = float(os.getenv("LM_BACKGROUND_MAX_WAIT", 30.0))
+# Pin each conversation/session to one slot of its LM server (llama.cpp `id_slot`), so its
+# prompt prefix stays in that slot's KV cache between requests. Slots are counted per server:
+# LM_SLOTS, or `total_slots` from the server's /props (see common/lm_router.py)
+LM_SLOT_AFFINITY = os.getenv("LM_SLOT_AFFINITY", "false").lower() in ("1", "true", "yes", "on")
+
+
+# Generated stories are cached by prompt, model and sampling parameters
+STORY_CACHE_ENABLED = os.getenv("STORY_CACHE_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+STORY_CACHE_PATH = os.getenv("STORY_CACHE_PATH", str(Path(__file__).resolve().parent / "story_cache.sqlite3"))
+STORY_CACHE_MEMORY_ENTRIES = int(os.getenv("STORY_CACHE_MEMORY_ENTRIES", 256))
+STORY_CACHE_DISK_ENTRIES = int(os.getenv("STORY_CACHE_DISK_ENTRIES", 10000))
+STORY_CACHE_TTL_SECONDS = float(os.getenv("STORY_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+
+# /generate-story/batch: stories generated at once per batch, and batch size limit
+STORY_BATCH_CONCURRENCY = int(os.getenv("STORY_BATCH_CONCURRENCY", 2))
+STORY_BATCH_MAX_CONCURRENCY = int(os.getenv("STORY_BATCH_MAX_CONCURRENCY", 8))
+STORY_BATCH_MAX_ENTRIES = int(os.getenv("STORY_BATCH_MAX_ENTRIES", 500))
+
+# Chat history beyond this many tokens is folded into a rolling summary per conversation
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", 1500))
+CHAT_SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", 256))
+CHAT_SUMMARY_CACHE_SIZE = int(os.getenv("CHAT_SUMMARY_CACHE_SIZE", 1024))
+
+# Pooled keep-alive clients for the LM servers, opened with the app
+lm_router: Optional[LMRouter] = None
+story_cache: Optional[StoryCache] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global lm_router, story_cache
+    lm_router = LMRouter.from_env(f"http://{HOST}:{PORT}", timeout=LM_TIMEOUT, max_connections=LM_CONCURRENCY * 2)
+    await lm_router.start()
+    if STORY_CACHE_ENABLED:
+        story_cache = StoryCache(
+            STORY_CACHE_PATH, STORY_CACHE_MEMORY_ENTRIES, STORY_CACHE_DISK_ENTRIES, STORY_CACHE_TTL_SECONDS
+        )
+    try:
+        yield
+    finally:
+        await lm_router.close()
+        lm_router = None
+        if story_cache is not None:
+            story_cache.close()
+            story_cache = None
+
+
+app = FastAPI(lifespan=lifespan)
+metrics.instrument(app, "ai")
 
 # Add CORS middleware to the FastAPI app
 app.add_middleware(
@@ -17,11 +95,6 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all headers
 )
 
-# Define server details
-HOST = "localhost"
-PORT = 1234  # Update this to match your LM Studio API port
-
-
 # Request models for the API endpoints
 
 class GenerateStoryRequest(BaseModel):
@@ -30,6 +103,28 @@ class GenerateStoryRequest(BaseModel):
     This model expects an annotated diary entry to generate a story.
     """
     diary_entry: str  # The annotated diary entry text for storytelling
+    stream: bool = False  # Stream tokens back as server-sent events
+    priority: Literal["interactive", "background"] = BACKGROUND  # Scheduling class of the LM call
+    fresh: bool = False  # Generate a new variant instead of serving a cached story
+    session_id: Optional[str] = None  # Pins related generations to the same LM slot
+
+
+class BatchStoryEntry(BaseModel):
+    """
+    One diary entry of a `/generate-story/batch` request.
+    """
+    diary_entry: str  # The annotated diary entry text for storytelling
+    id: Optional[str] = None  # Caller's identifier, echoed back with the result
+
+
+class GenerateStoryBatchRequest(BaseModel):
+    """
+    Request model for the `/generate-story/batch` endpoint.
+    """
+    entries: List[BatchStoryEntry]  # The diary entries to generate stories for
+    concurrency: Optional[int] = None  # Stories generated at once (capped by STORY_BATCH_MAX_CONCURRENCY)
+    priority: Literal["interactive", "background"] = BACKGROUND  # Scheduling class of the LM calls
+    fresh: bool = False  # Generate new variants instead of serving cached stories
 
 
 class ChatRequest(BaseModel):
@@ -39,96 +134,326 @@ class ChatRequest(BaseModel):
     """
     latest_msg: str  # The most recent message from the user
     prev_msgs: List[str]  # A list of previous messages for context
+    stream: bool = False  # Stream tokens back as server-sent events
+    conversation_id: Optional[str] = None  # Identifies the conversation whose summary is cached
+    priority: Literal["interactive", "background"] = INTERACTIVE  # Scheduling class of the LM call
+
 
+class GenerationStats:
+    """
+    Timing of a single LM generation: time-to-first-token and decode throughput.
+    Both `ttft_ms` and `total_ms` include the time spent waiting for an LM slot (`queue_wait_ms`).
+    """
 
-# Prompt template for storytelling
-def create_story_prompt(diary_entry: str) -> str:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.completion_tokens = 0
+        self.queue_wait = 0.0
+
+    def token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.completion_tokens += 1
+
+    def finish(self, completion_tokens: Optional[int] = None):
+        self.finished_at = time.perf_counter()
+        if self.first_token_at is None:
+            # Non-streaming: the first token arrives together with the whole completion
+            self.first_token_at = self.finished_at
+        if completion_tokens is not None:
+            self.completion_tokens = completion_tokens
+
+    def as_dict(self) -> dict:
+        finished_at = self.finished_at or time.perf_counter()
+        first_token_at = self.first_token_at or finished_at
+        generation_time = finished_at - first_token_at
+        if generation_time <= 0:
+            # The whole completion arrived at once, so use the time since the call was admitted
+            generation_time = finished_at - self.started - self.queue_wait
+        return {
+            "queue_wait_ms": round(self.queue_wait * 1000, 1),
+            "ttft_ms": round((first_token_at - self.started) * 1000, 1),
+            "total_ms": round((finished_at - self.started) * 1000, 1),
+            "completion_tokens": self.completion_tokens,
+            "tokens_per_sec": round(self.completion_tokens / generation_time, 2) if generation_time > 0 else 0.0,
+        }
+
+    def log(self, kind: str):
+        stats = self.as_dict()
+        logger.info(
+            f"{kind}: queue_wait={stats['queue_wait_ms']}ms ttft={stats['ttft_ms']}ms total={stats['total_ms']}ms "
+            f"tokens={stats['completion_tokens']} tokens/sec={stats['tokens_per_sec']}"
+        )
+
+
+def build_lm_payload(messages: Messages, stream: bool = False, max_tokens: int = 2048) -> dict:
     """
-    Create a storytelling prompt based on the annotated diary entry.
+    Build the chat completion request body for the language model.
 
     Args:
-    - diary_entry (str): The annotated diary entry to base the story on.
+    - messages (Messages): The prompt messages to send to the language model.
+    - stream (bool): Whether the LM server should stream tokens as server-sent events.
+    - max_tokens (int): Upper bound on the completion length.
 
     Returns:
-    - str: A formatted storytelling prompt.
-    """
-    return (
-        "You are an expert storyteller and memory preservation specialist. "
-        "Your goal is to transform a diary entry into a deeply immersive, fictionalized story. "
-        "Focus on emotions, atmosphere, and subtle personal reflections. "
-        "Ensure the narrative flows naturally while enhancing the moment through rich details.\n\n"
-        "**Annotated Diary Entry for Storytelling:**\n"
-        f"{diary_entry}\n\n"
-        "**Storytelling Instructions:**\n"
-        "1. **Retain the core essence** of the diary entry—the names of people, the overall scenario, and key events must remain recognizable.\n"
-        "2. **Enhance the story with fictional elements**—add interesting events or subtle moments that make the scene more engaging and thought-provoking.\n"
-        "3. **Encourage deep reflection**—the goal is for the reader to recall this memory vividly, as if it was their own.\n"
-        "4. **Expand beyond the initial event**—what are the ripple effects of this moment? How does it shape the emotions and relationships involved?\n"
-        "5. **Use rich sensory details**—bring the reader into the scene with descriptions of scents, sounds, touch, and subtle visual cues.\n"
-        "6. **Conclude with a sense of impact**, leaving the reader with a lingering emotion or a sense of nostalgia.\n"
-        "\n**Avoid generic storytelling. Instead, craft a narrative that feels deeply personal and unique, allowing the reader to feel as though they are reliving this memory with fresh depth and significance.**"
-    )
+    - dict: The request body for `/v1/chat/completions`.
+    """
+    return {
+        "model": LM_MODEL,
+        "messages": messages,
+        "temperature": 1.0,
+        "top_p": 0.9,
+        "max_tokens": max_tokens,
+        "stream": stream,
+    }
 
 
-# Prompt template for general chat
-def create_chat_prompt(user_message: str, prev_msgs: List[str]) -> str:
+async def get_lm_response(
+    payload: dict, stats: Optional[GenerationStats] = None, session_id: Optional[str] = None
+):
     """
-    Create a chat prompt based on the user's latest message and the previous messages for conversation context.
+    Get the language model's response for a non-streaming request body.
 
     Args:
-    - user_message (str): The most recent message from the user.
-    - prev_msgs (List[str]): List of previous messages for context.
+    - payload (dict): The request body from `build_lm_payload`.
+    - stats (GenerationStats, optional): Filled in with the generation timings.
+    - session_id (str, optional): Keeps the session on one LM server (and slot, with `LM_SLOT_AFFINITY`).
 
     Returns:
-    - str: A formatted chat prompt.
-    """
-    # Combine previous messages into a conversation history
-    conversation_history = "\n".join(prev_msgs)
-    prompt = (
-        f"You are a friendly and intelligent AI assistant. "
-        f"Engage in helpful and insightful conversations. "
-        f"Be natural, concise, and provide informative responses.\n\n"
-        f"**Conversation History:**\n{conversation_history}\n\n"
-        f"**User Query:**\n{user_message}\n\n"
-        "**Instructions:**\n"
-        "1. Respond in a natural conversational tone.\n"
-        "2. Provide relevant details concisely without unnecessary verbosity.\n"
-        "3. If the user asks a follow-up question, continue the conversation naturally.\n"
-        "4. Keep responses engaging and helpful.\n"
-        "5. If the question is open-ended, provide a balanced perspective."
+    - str: The full response from the language model as a plain string.
+    """
+    res = await lm_router.post(
+        "/v1/chat/completions", json=payload, session_id=session_id, pin_slot=LM_SLOT_AFFINITY
     )
-    return prompt
+    res.raise_for_status()
 
+    # Assuming the response is in JSON format and contains 'choices' with 'text'
+    response_data = res.json()
+    story_content = response_data["choices"][0]["message"]["content"]
+
+    if stats is not None:
+        stats.finish(response_data.get("usage", {}).get("completion_tokens"))
+
+    return story_content
+
+
+# Bounded, prioritized access to the LM server's generation slots
+lm_scheduler = LMScheduler(LM_CONCURRENCY, LM_BACKGROUND_MAX_WAIT)
+metrics.track_queue("lm_running", lambda: lm_scheduler.running)
+for _priority in PRIORITIES:
+    metrics.track_queue(f"lm_waiting_{_priority}", lambda priority=_priority: lm_scheduler.waiting(priority))
+
+
+@asynccontextmanager
+async def lm_slot(priority: str, stats: GenerationStats):
+    """
+    Wait for an LM slot in the given priority class and record the wait in `stats`.
+    The wait is also reported as `lm_queue` in metrics and the Server-Timing header.
+    """
+    async with lm_scheduler.slot(priority) as wait:
+        stats.queue_wait = wait
+        metrics.record_upstream("lm_queue", wait)
+        yield
 
-def get_lm_response(prompt: str):
+
+# Concurrent identical LM requests share a single completion
+lm_flights = SingleFlight()
+metrics.track_queue("lm_calls_in_flight", lambda: lm_flights.stats()["in_flight"])
+
+
+async def complete(
+    messages: Messages,
+    kind: str,
+    priority: str,
+    max_tokens: int = 2048,
+    session_id: Optional[str] = None,
+) -> Tuple[str, dict]:
     """
-    Get the language model's response based on the provided prompt.
+    Get the language model's response once an LM slot is free, sharing the completion
+    with any identical request (same prompt and sampling parameters) in flight.
 
     Args:
-    - prompt (str): The prompt to send to the language model.
+    - messages (Messages): The prompt messages to send to the language model.
+    - kind (str): Name of the calling endpoint, used in logs.
+    - priority (str): Scheduling class, `interactive` or `background`.
+    - max_tokens (int): Upper bound on the completion length.
+    - session_id (str, optional): Pins the call to the session's LM slot.
 
     Returns:
-    - str: The full response from the language model as a plain string.
+    - Tuple[str, dict]: The response content and its generation stats.
     """
-    payload = json.dumps({
-        "model": "amethyst-13b-mistral",
-        "messages": [{"role": "system", "content": prompt}],
-        "temperature": 1.0,
-        "top_p": 0.9,
-        "max_tokens": 2048,
-        "stream": False  # Disable streaming
-    })
-    headers = {"Content-Type": "application/json"}
-    conn = http.client.HTTPConnection(HOST, PORT)
-    conn.request("POST", "/v1/chat/completions", payload, headers)
-    res = conn.getresponse()
-    data = res.read().decode("utf-8")
+    payload = build_lm_payload(messages, stream=False, max_tokens=max_tokens)
+
+    async def call():
+        stats = GenerationStats()
+        async with lm_slot(priority, stats):
+            with metrics.upstream_timer("lm_studio"):
+                content = await get_lm_response(payload, stats, session_id)
+        stats.log(kind)
+        return content, stats.as_dict()
+
+    (content, stats), coalesced = await lm_flights.do(payload_key(payload), call)
+    if coalesced:
+        metrics.count("lm_call_coalesced")
+        logger.info(f"{kind}: coalesced with an identical in-flight request")
+    return content, {**stats, "coalesced": coalesced}
+
+
+async def stream_lm_response(
+    messages: Messages,
+    stats: GenerationStats,
+    priority: str,
+    session_id: Optional[str] = None,
+) -> AsyncIterator[str]:
+    """
+    Stream the language model's response token by token.
 
-    # Assuming the response is in JSON format and contains 'choices' with 'text'
-    response_data = json.loads(data)
-    story_content = response_data["choices"][0]["message"]["content"]
+    Consumes the LM Studio server-sent event stream and yields each content delta.
+    The LM slot is held until the stream ends.
 
-    return story_content
+    Args:
+    - messages (Messages): The prompt messages to send to the language model.
+    - stats (GenerationStats): Updated as tokens arrive.
+    - priority (str): Scheduling class, `interactive` or `background`.
+    - session_id (str, optional): Pins the call to the session's LM server and slot.
+
+    Yields:
+    - str: The next piece of generated text.
+    """
+    payload = build_lm_payload(messages, stream=True)
+    async with lm_slot(priority, stats):
+        with metrics.upstream_timer("lm_studio"):
+            async with lm_router.stream(
+                "POST", "/v1/chat/completions", json=payload, session_id=session_id, pin_slot=LM_SLOT_AFFINITY
+            ) as res:
+                res.raise_for_status()
+                usage_tokens = None
+                async for line in res.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    if chunk.get("usage"):
+                        usage_tokens = chunk["usage"].get("completion_tokens")
+                    choices = chunk.get("choices") or [{}]
+                    delta = choices[0].get("delta", {}).get("content")
+                    if delta:
+                        stats.token()
+                        yield delta
+                stats.finish(usage_tokens)
+
+
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    """
+    Format a server-sent event.
+    """
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+async def stream_generation(
+    messages: Messages,
+    kind: str,
+    priority: str,
+    on_complete: Optional[Callable[[str], Awaitable[None]]] = None,
+    extra_stats: Optional[dict] = None,
+    session_id: Optional[str] = None,
+) -> AsyncIterator[str]:
+    """
+    Re-emit LM tokens as server-sent events.
+
+    Each token is sent as `data: {"token": ...}`. The stream ends with a `done` event
+    carrying the generation stats (plus `extra_stats`), or an `error` event if the LM call fails.
+    `on_complete` receives the full text once the whole completion has been streamed.
+    """
+    stats = GenerationStats()
+    tokens = []
+    try:
+        async for token in stream_lm_response(messages, stats, priority, session_id):
+            tokens.append(token)
+            yield sse_event({"token": token})
+    except Exception as exc:
+        logger.error(f"{kind}: streaming failed: {exc}")
+        yield sse_event({"detail": str(exc)}, event="error")
+        return
+    stats.log(kind)
+    if on_complete is not None:
+        await on_complete("".join(tokens))
+    yield sse_event({**stats.as_dict(), **(extra_stats or {})}, event="done")
+
+
+async def replay_cached(content: str, stats: dict) -> AsyncIterator[str]:
+    """
+    Send a cached completion in the same event format as `stream_generation`, as a single token.
+    """
+    yield sse_event({"token": content})
+    yield sse_event(stats, event="done")
+
+
+def sse_response(events: AsyncIterator[str]) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def story_cache_key(prompt: Messages) -> str:
+    # Prompt, model and sampling parameters; the LM slot does not change the story
+    return payload_key(build_lm_payload(prompt, stream=False))
+
+
+async def lookup_story(cache_key: str) -> Optional[Tuple[str, dict]]:
+    """
+    Return a cached story and its stats, or None on a miss (or with the cache disabled).
+    """
+    if story_cache is None:
+        return None
+    cached = await story_cache.get(cache_key)
+    if cached is None:
+        metrics.count("story_cache_miss")
+        return None
+    metrics.count(f"story_cache_hit_{cached['tier']}")
+    return cached["story"], {"cached": True, "cache_tier": cached["tier"], "cache_age_s": cached["age_s"]}
+
+
+async def cache_story(cache_key: str, story: str):
+    if story_cache is not None and story:
+        await story_cache.put(cache_key, story)
+
+
+async def generate_story_content(
+    diary_entry: str,
+    priority: str,
+    fresh: bool = False,
+    session_id: Optional[str] = None,
+) -> Tuple[str, dict]:
+    """
+    Generate a story for a diary entry, or serve it from the story cache.
+
+    Args:
+    - diary_entry (str): The annotated diary entry to base the story on.
+    - priority (str): Scheduling class, `interactive` or `background`.
+    - fresh (bool): Skip the cache and generate a new variant.
+    - session_id (str, optional): Pins the call to the session's LM slot.
+
+    Returns:
+    - Tuple[str, dict]: The story and its stats.
+    """
+    prompt = create_story_prompt(diary_entry)
+    cache_key = story_cache_key(prompt)
+    if not fresh:
+        cached = await lookup_story(cache_key)
+        if cached is not None:
+            return cached
+
+    story_content, stats = await complete(prompt, "generate-story", priority, session_id=session_id)
+    await cache_story(cache_key, story_content)
+    return story_content, {**stats, "cached": False}
 
 
 @app.post("/generate-story", response_description="Generate a fictionalized story from an annotated diary entry")
@@ -137,13 +462,98 @@ async def generate_story(request: GenerateStoryRequest):
     Endpoint to generate a fictionalized story based on an annotated diary entry.
 
     - **diary_entry**: The annotated diary entry to base the story on.
+    - **stream**: If true, tokens are streamed back as server-sent events.
+    - **priority**: `background` (default) or `interactive` when a user is waiting for the story.
+    - **fresh**: If true, skip the story cache and generate a new variant (which replaces the cached one).
+    - **session_id**: Optional; with `LM_SLOT_AFFINITY`, related generations share an LM slot.
 
-    Returns the extracted story content as a plain string.
+    Returns the extracted story content as a plain string, along with generation stats.
+    Cached stories are marked with `"cached": true` in the stats.
     """
-    diary_entry = request.diary_entry
-    prompt = create_story_prompt(diary_entry)
-    story_content = get_lm_response(prompt)
-    return JSONResponse(content={"story": story_content})
+    if not request.stream:
+        story_content, stats = await generate_story_content(
+            request.diary_entry, request.priority, request.fresh, request.session_id
+        )
+        return JSONResponse(content={"story": story_content, "stats": stats})
+
+    prompt = create_story_prompt(request.diary_entry)
+    cache_key = story_cache_key(prompt)
+    cached = None if request.fresh else await lookup_story(cache_key)
+    if cached is not None:
+        return sse_response(replay_cached(*cached))
+
+    async def on_complete(story: str):
+        await cache_story(cache_key, story)
+
+    return sse_response(stream_generation(
+        prompt, "generate-story", request.priority, on_complete=on_complete, session_id=request.session_id
+    ))
+
+
+@app.post("/generate-story/batch", response_description="Generate stories for many diary entries, streamed as NDJSON")
+async def generate_story_batch(request: GenerateStoryBatchRequest):
+    """
+    Endpoint to generate stories for many annotated diary entries in one call.
+
+    - **entries**: The diary entries, each with an optional caller-chosen `id`.
+    - **concurrency**: Stories generated at once (default and maximum set by
+      `STORY_BATCH_CONCURRENCY` / `STORY_BATCH_MAX_CONCURRENCY`).
+    - **priority**: `background` (default) or `interactive`.
+    - **fresh**: If true, skip the story cache for every entry.
+
+    Streams newline-delimited JSON, one line per entry as soon as its story is ready (so in
+    completion order, not request order): `index`, `id`, and either `story` and `stats` or
+    `error`. A final line carries `done`, the number of stories and errors, and the total time.
+    """
+    if len(request.entries) > STORY_BATCH_MAX_ENTRIES:
+        raise HTTPException(
+            status_code=413, detail=f"At most {STORY_BATCH_MAX_ENTRIES} entries per batch, got {len(request.entries)}"
+        )
+    concurrency = max(1, min(request.concurrency or STORY_BATCH_CONCURRENCY, STORY_BATCH_MAX_CONCURRENCY))
+    started = time.perf_counter()
+
+    async def body():
+        slots = asyncio.Semaphore(concurrency)
+
+        async def run(index: int, entry: BatchStoryEntry) -> dict:
+            async with slots:
+                try:
+                    story, stats = await generate_story_content(entry.diary_entry, request.priority, request.fresh)
+                    return {"index": index, "id": entry.id, "story": story, "stats": stats}
+                except Exception as exc:
+                    logger.error(f"generate-story/batch: entry {index} failed: {exc}")
+                    return {"index": index, "id": entry.id, "error": str(exc)}
+
+        tasks = [asyncio.ensure_future(run(index, entry)) for index, entry in enumerate(request.entries)]
+        errors = 0
+        try:
+            for finished in asyncio.as_completed(tasks):
+                result = await finished
+                errors += "error" in result
+                yield json.dumps(result) + "\n"
+        finally:
+            # Stop generating if the client went away
+            for task in tasks:
+                task.cancel()
+        total_ms = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(f"generate-story/batch: {len(tasks)} entries, {errors} errors, concurrency {concurrency}, {total_ms}ms")
+        yield json.dumps({"done": True, "stories": len(tasks) - errors, "errors": errors, "total_ms": total_ms}) + "\n"
+
+    return StreamingResponse(body(), media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
+
+async def summarize_history(previous_summary: Optional[str], messages: List[str]) -> str:
+    """
+    Fold chat turns into a conversation's rolling summary with the language model.
+    """
+    prompt = create_summary_prompt(previous_summary, messages, max_words=CHAT_SUMMARY_MAX_TOKENS * 3 // 4)
+    summary, _ = await complete(prompt, "chat-summary", INTERACTIVE, max_tokens=CHAT_SUMMARY_MAX_TOKENS)
+    return summary
+
+
+chat_contexts = ChatContextManager(
+    summarize_history, CHAT_HISTORY_TOKEN_BUDGET, max_conversations=CHAT_SUMMARY_CACHE_SIZE
+)
 
 
 @app.post("/chat", response_description="Generate a conversation response based on the latest message and context")
@@ -154,14 +564,45 @@ async def chat(request: ChatRequest):
 
     - **latest_msg**: The most recent message from the user.
     - **prev_msgs**: A list of previous messages for context.
+    - **stream**: If true, tokens are streamed back as server-sent events.
+    - **priority**: `interactive` (default) or `background`.
+    - **conversation_id**: Identifies the conversation, so the summary of its older turns is reused
+      (and, with `LM_SLOT_AFFINITY`, its prompt stays cached in the same LM slot).
 
-    Returns the chat response content as a plain string.
+    Returns the chat response content as a plain string, along with generation stats.
+    The stats include a `context` section with the prompt's token counts.
     """
     user_message = request.latest_msg
     prev_messages = request.prev_msgs
-    prompt = create_chat_prompt(user_message, prev_messages)
-    chat_content = get_lm_response(prompt)
-    return JSONResponse(content={"response": chat_content})
+    # Without an id the summary is reused by the exact history it covers, and the
+    # conversation is not pinned to an LM server or slot
+    conversation_id = request.conversation_id
+    context = await chat_contexts.build(conversation_id, prev_messages)
+    prompt = create_chat_prompt(user_message, context.recent, context.summary)
+    context_stats = {"context": {**context.stats, "prompt_tokens": count_tokens(prompt_text(prompt))}}
+    if request.stream:
+        return sse_response(stream_generation(
+            prompt, "chat", request.priority, extra_stats=context_stats, session_id=conversation_id
+        ))
+
+    chat_content, stats = await complete(prompt, "chat", request.priority, session_id=conversation_id)
+    return JSONResponse(content={"response": chat_content, "stats": {**stats, **context_stats}})
+
+
+@app.get("/lm/stats", response_description="Language model request statistics")
+async def lm_stats():
+    """
+    Counters for LM calls made versus requests coalesced onto an identical in-flight call,
+    the scheduler's running calls, queue lengths and wait times per priority class,
+    and the health, load and latency of each LM server.
+    """
+    return {
+        "singleflight": lm_flights.stats(),
+        "scheduler": lm_scheduler.stats(),
+        "story_cache": story_cache.stats() if story_cache is not None else None,
+        "chat_context": chat_contexts.stats(),
+        "router": lm_router.stats() if lm_router is not None else None,
+    }
 
 
 if __name__ == "__main__":
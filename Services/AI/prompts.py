@@ -0,0 +1,125 @@
+"""
+Prompt builders for the AI service.
+
+Each builder returns the chat `messages` for the LM request. The long, static instructions
+are the first (system) message and are byte-identical across requests; everything that
+varies goes in the user message after them. LM servers with prompt caching (llama.cpp,
+LM Studio) can then reuse the KV cache of the instructions and only prefill the new part.
+Keep the system prompts free of anything request-specific.
+"""
+from typing import Dict, List, Optional
+
+STORY_SYSTEM_PROMPT = (
+    "You are an expert storyteller and memory preservation specialist. "
+    "Your goal is to transform a diary entry into a deeply immersive, fictionalized story. "
+    "Focus on emotions, atmosphere, and subtle personal reflections. "
+    "Ensure the narrative flows naturally while enhancing the moment through rich details.\n\n"
+    "**Storytelling Instructions:**\n"
+    "1. **Retain the core essence** of the diary entry—the names of people, the overall scenario, and key events must remain recognizable.\n"
+    "2. **Enhance the story with fictional elements**—add interesting events or subtle moments that make the scene more engaging and thought-provoking.\n"
+    "3. **Encourage deep reflection**—the goal is for the reader to recall this memory vividly, as if it was their own.\n"
+    "4. **Expand beyond the initial event**—what are the ripple effects of this moment? How does it shape the emotions and relationships involved?\n"
+    "5. **Use rich sensory details**—bring the reader into the scene with descriptions of scents, sounds, touch, and subtle visual cues.\n"
+    "6. **Conclude with a sense of impact**, leaving the reader with a lingering emotion or a sense of nostalgia.\n"
+    "\n**Avoid generic storytelling. Instead, craft a narrative that feels deeply personal and unique, allowing the reader to feel as though they are reliving this memory with fresh depth and significance.**"
+)
+
+CHAT_SYSTEM_PROMPT = (
+    "You are a friendly and intelligent AI assistant. "
+    "Engage in helpful and insightful conversations. "
+    "Be natural, concise, and provide informative responses.\n\n"
+    "**Instructions:**\n"
+    "1. Respond in a natural conversational tone.\n"
+    "2. Provide relevant details concisely without unnecessary verbosity.\n"
+    "3. If the user asks a follow-up question, continue the conversation naturally.\n"
+    "4. Keep responses engaging and helpful.\n"
+    "5. If the question is open-ended, provide a balanced perspective."
+)
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an AI assistant. "
+    "Update the summary so it also covers the new messages.\n\n"
+    "**Instructions:**\n"
+    "1. Keep names, relationships, places, dates and anything the user asked to remember.\n"
+    "2. Keep open questions and the user's preferences.\n"
+    "3. Write plain prose. Reply with the summary only."
+)
+
+Messages = List[Dict[str, str]]
+
+
+def _messages(system_prompt: str, user_content: str) -> Messages:
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_content},
+    ]
+
+
+# Prompt template for storytelling
+def create_story_prompt(diary_entry: str) -> Messages:
+    """
+    Create a storytelling prompt based on the annotated diary entry.
+
+    Args:
+    - diary_entry (str): The annotated diary entry to base the story on.
+
+    Returns:
+    - Messages: The static storytelling instructions, then the diary entry.
+    """
+    return _messages(STORY_SYSTEM_PROMPT, f"**Annotated Diary Entry for Storytelling:**\n{diary_entry}")
+
+
+# Prompt template for general chat
+def create_chat_prompt(user_message: str, prev_msgs: List[str], summary: Optional[str] = None) -> Messages:
+    """
+    Create a chat prompt based on the user's latest message and the previous messages for conversation context.
+
+    The user message is ordered from the least to the most frequently changing part
+    (summary, history, latest message), so consecutive turns of a conversation share
+    the longest possible prefix.
+
+    Args:
+    - user_message (str): The most recent message from the user.
+    - prev_msgs (List[str]): List of previous messages for context.
+    - summary (str, optional): Summary of the conversation before `prev_msgs`.
+
+    Returns:
+    - Messages: The static chat instructions, then the conversation and query.
+    """
+    # Combine previous messages into a conversation history
+    conversation_history = "\n".join(prev_msgs)
+    earlier = f"**Summary of Earlier Conversation:**\n{summary}\n\n" if summary else ""
+    return _messages(
+        CHAT_SYSTEM_PROMPT,
+        f"{earlier}"
+        f"**Conversation History:**\n{conversation_history}\n\n"
+        f"**User Query:**\n{user_message}",
+    )
+
+
+# Prompt template for folding older chat turns into the rolling summary
+def create_summary_prompt(previous_summary: Optional[str], messages: List[str], max_words: int) -> Messages:
+    """
+    Create a prompt that extends a conversation summary with the turns that follow it.
+
+    Args:
+    - previous_summary (str, optional): The summary so far, if any.
+    - messages (List[str]): The turns to fold into the summary, oldest first.
+    - max_words (int): Length limit for the summary.
+
+    Returns:
+    - Messages: The static summarization instructions, then the summary and new turns.
+    """
+    so_far = f"**Summary So Far:**\n{previous_summary}\n\n" if previous_summary else ""
+    new_turns = "\n".join(messages)
+    return _messages(
+        SUMMARY_SYSTEM_PROMPT,
+        f"{so_far}**New Messages:**\n{new_turns}\n\nWrite the updated summary in at most {max_words} words.",
+    )
+
+
+def prompt_text(messages: Messages) -> str:
+    """
+    All message contents joined, for token counting.
+    """
+    return "\n".join(message["content"] for message in messages)
@@ -0,0 +1,105 @@
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Tuple
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+PRIORITIES = (INTERACTIVE, BACKGROUND)
+
+
+class LMScheduler:
+    """
+    Admits LM calls up to the number of generations the LM server can run at once.
+
+    Waiting interactive calls (chat) are always admitted before background calls
+    (story generation), except that a background call waiting longer than
+    `background_max_wait` seconds goes next, so background work cannot starve.
+    """
+
+    def __init__(self, concurrency: int, background_max_wait: float = 30.0):
+        self.concurrency = concurrency
+        self.background_max_wait = background_max_wait
+        self.running = 0
+        self._queues: Dict[str, Deque[Tuple[float, asyncio.Future]]] = {priority: deque() for priority in PRIORITIES}
+        self.admitted = {priority: 0 for priority in PRIORITIES}
+        self.total_wait = {priority: 0.0 for priority in PRIORITIES}
+        self.max_wait = {priority: 0.0 for priority in PRIORITIES}
+
+    def waiting(self, priority: str) -> int:
+        return sum(1 for _, waiter in self._queues[priority] if not waiter.done())
+
+    @asynccontextmanager
+    async def slot(self, priority: str = INTERACTIVE) -> AsyncIterator[float]:
+        """
+        Hold one LM slot for the duration of the block.
+
+        Args:
+        - priority (str): `interactive` or `background`.
+
+        Yields:
+        - float: Seconds spent waiting for the slot.
+        """
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority: {priority}")
+        queued_at = time.perf_counter()
+        if self.running < self.concurrency and not any(self._queues.values()):
+            self.running += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            entry = (queued_at, waiter)
+            self._queues[priority].append(entry)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # Admitted just as the caller went away: pass the slot on
+                    self._release()
+                elif entry in self._queues[priority]:
+                    self._queues[priority].remove(entry)
+                raise
+
+        wait = time.perf_counter() - queued_at
+        self.admitted[priority] += 1
+        self.total_wait[priority] += wait
+        self.max_wait[priority] = max(self.max_wait[priority], wait)
+        try:
+            yield wait
+        finally:
+            self._release()
+
+    def _next_waiter(self):
+        background = self._queues[BACKGROUND]
+        if background and time.perf_counter() - background[0][0] >= self.background_max_wait:
+            return background.popleft()[1]
+        for priority in PRIORITIES:
+            if self._queues[priority]:
+                return self._queues[priority].popleft()[1]
+        return None
+
+    def _release(self):
+        self.running -= 1
+        while self.running < self.concurrency:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            if not waiter.done():
+                self.running += 1
+                waiter.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "concurrency": self.concurrency,
+            "running": self.running,
+            **{
+                priority: {
+                    "waiting": self.waiting(priority),
+                    "admitted": self.admitted[priority],
+                    "avg_wait_ms": round(self.total_wait[priority] / self.admitted[priority] * 1000, 1)
+                    if self.admitted[priority] else 0.0,
+                    "max_wait_ms": round(self.max_wait[priority] * 1000, 1),
+                }
+                for priority in PRIORITIES
+            },
+        }
@@ -0,0 +1,68 @@
+import json
+import asyncio
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+
+def payload_key(payload: Dict[str, Any]) -> str:
+    """
+    Stable hash of an LM request body (prompt plus sampling parameters).
+
+    Args:
+    - payload (dict): The request body sent to the language model.
+
+    Returns:
+    - str: A hex digest that is identical for identical requests.
+    """
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key so that they share one execution.
+
+    The first caller for a key starts the call; callers arriving while it is still running
+    wait for the same result instead of starting their own. A caller that disconnects does
+    not cancel the shared call for the others.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.calls = 0  # Calls that actually ran
+        self.coalesced = 0  # Calls that joined one already running
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Run `fn` unless an identical call is already in flight.
+
+        Args:
+        - key (str): Identifies identical calls.
+        - fn (Callable): Coroutine function performing the call.
+
+        Returns:
+        - Tuple[Any, bool]: The result and whether it was shared with an earlier caller.
+        """
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future), True
+
+        self.calls += 1
+        future = asyncio.ensure_future(fn())
+        self._in_flight[key] = future
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(future), False
+
+    def _forget(self, key: str, future: asyncio.Future):
+        if self._in_flight.get(key) is future:
+            del self._in_flight[key]
+
+    def stats(self) -> Dict[str, Any]:
+        requests = self.calls + self.coalesced
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "coalesced_ratio": self.coalesced / requests if requests else 0.0,
+            "in_flight": len(self._in_flight),
+        }
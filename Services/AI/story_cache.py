@@ -0,0 +1,129 @@
+import time
+import sqlite3
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+class StoryCache:
+    """
+    Two-tier cache of generated stories, keyed by the hash of the LM request
+    (prompt, model and sampling parameters; see `singleflight.payload_key`).
+
+    The memory tier is a small LRU in front of an SQLite file, so cached stories survive
+    restarts. Both tiers are capped in entries and expire entries after `ttl` seconds;
+    the disk tier evicts its least recently used entries when over its cap.
+
+    Args:
+    - path (str): SQLite database file for the disk tier.
+    - memory_entries (int): Maximum number of stories kept in memory.
+    - disk_entries (int): Maximum number of stories kept on disk.
+    - ttl (float): Seconds a story stays valid after it was generated.
+    """
+
+    def __init__(self, path: str, memory_entries: int, disk_entries: int, ttl: float):
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.ttl = ttl
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS stories ("
+                " key TEXT PRIMARY KEY,"
+                " story TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS ix_stories_last_used ON stories (last_used)")
+            # Kept up to date by the disk writes, so stats() never queries SQLite on the event loop
+            self._disk_entries = self._db.execute("SELECT count(*) FROM stories").fetchone()[0]
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+
+    def _expired(self, created_at: float) -> bool:
+        return time.time() - created_at > self.ttl
+
+    def _remember(self, key: str, story: str, created_at: float):
+        self._memory[key] = (story, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock, self._db:
+            row = self._db.execute("SELECT story, created_at FROM stories WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self._expired(row[1]):
+                self._db.execute("DELETE FROM stories WHERE key = ?", (key,))
+                self._disk_entries -= 1
+                return None
+            self._db.execute("UPDATE stories SET last_used = ? WHERE key = ?", (time.time(), key))
+            return row[0], row[1]
+
+    def _disk_put(self, key: str, story: str, created_at: float):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO stories (key, story, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, story, created_at, created_at),
+            )
+            self._db.execute("DELETE FROM stories WHERE created_at < ?", (time.time() - self.ttl,))
+            self._db.execute(
+                "DELETE FROM stories WHERE key IN ("
+                " SELECT key FROM stories ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.disk_entries,),
+            )
+            # Counted while the writes are on a worker thread anyway
+            self._disk_entries = self._db.execute("SELECT count(*) FROM stories").fetchone()[0]
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a story, memory tier first.
+
+        Returns:
+        - dict or None: `story`, the `tier` it came from and its `age_s`, or None on a miss.
+        """
+        entry = self._memory.get(key)
+        if entry is not None and self._expired(entry[1]):
+            del self._memory[key]
+            entry = None
+        tier = "memory"
+        if entry is not None:
+            self._memory.move_to_end(key)
+        else:
+            tier = "disk"
+            entry = await asyncio.to_thread(self._disk_get, key)
+            if entry is not None:
+                self._remember(key, *entry)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits[tier] += 1
+        story, created_at = entry
+        return {"story": story, "tier": tier, "age_s": round(time.time() - created_at, 1)}
+
+    async def put(self, key: str, story: str):
+        """
+        Store a story in both tiers, replacing any earlier variant for the same key.
+        """
+        created_at = time.time()
+        self._remember(key, story, created_at)
+        await asyncio.to_thread(self._disk_put, key, story, created_at)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = sum(self.hits.values()) + self.misses
+        return {
+            "memory_entries": len(self._memory),
+            "disk_entries": self._disk_entries,
+            "hits": dict(self.hits),
+            "misses": self.misses,
+            "hit_ratio": sum(self.hits.values()) / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
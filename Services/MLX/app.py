@@ -2,13 +2,19 @@ from fastapi import FastAPI, UploadFile, File
 import subprocess
 from pathlib import Path
 import os
+import sys
 import uvicorn
 
+# Shared modules live in Services/common
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common import metrics
+
 app = FastAPI(
     title="F5-TTS-MLX Voice Cloning API",
     description="A FastAPI-based service for voice cloning using F5-TTS-MLX.",
     version="1.0.0"
 )
+metrics.instrument(app, "tts-mlx")
 
 UPLOAD_FOLDER = "uploads"
 Path(UPLOAD_FOLDER).mkdir(exist_ok=True)
@@ -33,10 +39,11 @@ async def clone_voice(text: str, audio_file: UploadFile = File(...)):
 
     # Convert audio to required format using ffmpeg
     converted_audio = f"{UPLOAD_FOLDER}/converted_audio.wav"
-    subprocess.run([
-        "ffmpeg", "-i", file_path, "-ac", "1", "-ar", "24000",
-        "-sample_fmt", "s16", "-t", "10", converted_audio
-    ], check=True)
+    with metrics.upstream_timer("ffmpeg"):
+        subprocess.run([
+            "ffmpeg", "-i", file_path, "-ac", "1", "-ar", "24000",
+            "-sample_fmt", "s16", "-t", "10", converted_audio
+        ], check=True)
 
     # Run F5-TTS-MLX for voice cloning
     command = [
@@ -45,7 +52,8 @@ async def clone_voice(text: str, audio_file: UploadFile = File(...)):
         "--ref-audio", converted_audio,
         "--ref-text", text
     ]
-    subprocess.run(command, check=True)
+    with metrics.upstream_timer("tts_model"):
+        subprocess.run(command, check=True)
 
     return {"message": "Voice cloning completed!", "output_audio": output_audio}
 
@@ -2,6 +2,7 @@ from fastapi import FastAPI, UploadFile, File
 import subprocess
 from pathlib import Path
 import os
+import sys
 import uvicorn
 import scipy.io.wavfile as wav
 from TTS.api import TTS
@@ -11,11 +12,16 @@ import torch
 device = "mps" if torch.backends.mps.is_available() else "cpu"
 print(f"Using device: {device}")
 
+# Shared modules live in Services/common
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common import metrics
+
 app = FastAPI(
     title="Coqui TTS Voice Cloning API",
     description="A FastAPI-based service for voice cloning using Coqui TTS (your_tts) with MPS acceleration.",
     version="1.0.0"
 )
+metrics.instrument(app, "tts")
 
 UPLOAD_FOLDER = "uploads"
 OUTPUT_FOLDER = "outputs"
@@ -45,18 +51,20 @@ async def clone_voice(text: str, audio_file: UploadFile = File(...)):
 
     # Convert audio to required format using ffmpeg
     converted_audio = f"{UPLOAD_FOLDER}/converted_audio.wav"
-    subprocess.run([
-        "ffmpeg", "-i", file_path, "-ac", "1", "-ar", "24000",
-        "-sample_fmt", "s16", "-t", "10", converted_audio
-    ], check=True)
+    with metrics.upstream_timer("ffmpeg"):
+        subprocess.run([
+            "ffmpeg", "-i", file_path, "-ac", "1", "-ar", "24000",
+            "-sample_fmt", "s16", "-t", "10", converted_audio
+        ], check=True)
 
     # 🔹 Generate cloned voice with Coqui TTS using the reference speaker sample
-    tts.tts_to_file(
-        text=text,
-        speaker_wav=converted_audio,
-        language="en",  # Change if using other languages
-        file_path=output_audio_path
-    )
+    with metrics.upstream_timer("tts_model"):
+        tts.tts_to_file(
+            text=text,
+            speaker_wav=converted_audio,
+            language="en",  # Change if using other languages
+            file_path=output_audio_path
+        )
 
     return {"message": "Voice cloning completed!", "output_audio": output_audio_path}
 
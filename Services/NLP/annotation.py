@@ -0,0 +1,673 @@
+"""
+The NLP annotation pipeline: spaCy/Stanza extraction, coreference, writer detection
+and relationships from the profile, and the sentence embeddings of stories.
+
+Kept free of the web app and database, so it can run in worker processes
+(`NLPWorkerPool`), which import this module and load their own models.
+"""
+import os
+import re
+import json
+import time
+import bisect
+import asyncio
+import hashlib
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+from models import NLP_USE_STANZA, registry
+
+# Bulk annotation: entries per nlp.pipe batch (and per worker task), and spaCy worker
+# processes when annotating in-process (NLP_WORKERS=0)
+NLP_BULK_BATCH_SIZE = int(os.getenv("NLP_BULK_BATCH_SIZE", 32))
+NLP_BULK_PROCESSES = int(os.getenv("NLP_BULK_PROCESSES", os.cpu_count() or 1))
+# Seconds the worker processes get to load their models
+NLP_WORKER_START_TIMEOUT = float(os.getenv("NLP_WORKER_START_TIMEOUT", 600.0))
+# Profiles whose compiled relationship index each process keeps
+NLP_RELATIONSHIP_CACHE_SIZE = int(os.getenv("NLP_RELATIONSHIP_CACHE_SIZE", 1024))
+# Texts per sentence model forward pass
+NLP_EMBED_BATCH_SIZE = int(os.getenv("NLP_EMBED_BATCH_SIZE", 64))
+
+# ----------------------------
+# Dictionary for Common Relation Words
+# ----------------------------
+relation_words = {
+    "dad": ["pitaji", "baba", "abba", "appa", "achan"],
+    "mom": ["maa", "amma", "mataji", "aai"],
+    "brother": ["bhai", "anna", "annan", "ettan"],
+    "sister": ["didi", "akka", "chechi", "behan"],
+    "uncle": ["chacha", "mama", "kaka", "chittappa"],
+    "aunt": ["chachi", "maasi", "kaki", "chithi"],
+    "cousin": ["bhaiya", "didi"],
+    "teacher": ["guruji", "masterji", "acharya"],
+    "friend": ["dost", "mitra", "sakha", "yaar"],
+    "grandfather": ["dadaji", "thatha", "ajja", "nana"],
+    "grandmother": ["dadiji", "paati", "ajji", "nani"],
+    "son": ["beta", "magan", "putra"],
+    "daughter": ["beti", "magal", "putri"],
+    "husband": ["pati", "kanavan", "bharya"],
+    "wife": ["patni", "manaivi", "bharya"]
+}
+
+# ----------------------------
+# Helper Functions for Relationship Extraction
+# ----------------------------
+# Canonical relation of every relation word and synonym; a synonym listed under two
+# relations (e.g. "didi") keeps the first
+kinship_terms = {}
+for canonical, synonyms in relation_words.items():
+    kinship_terms.setdefault(canonical, canonical)
+    for synonym in synonyms:
+        kinship_terms.setdefault(synonym, canonical)
+
+def canonical_kinship(term):
+    term = term.lower()
+    return kinship_terms.get(term, term)
+
+# ----------------------------
+# Relationship Index
+# ----------------------------
+class RelationshipIndex:
+    """
+    A profile's relationships compiled into flat lookups, so resolving an entity is a
+    dictionary lookup rather than a graph search.
+
+    - Names and nicknames of family members and friends map to their relationship to the
+      profile owner (`son`, `daughter`, `friend`, ...). Grandchildren get the relationship
+      of their parent, the first hop from the profile owner.
+    - Canonical kinship terms (and their synonyms, through `kinship_terms`) map to the
+      family member the profile lists under that relationship, e.g. "Beti" to `daughter`.
+    """
+
+    def __init__(self, personal_data):
+        social = personal_data.get("social_interactions", {})
+        family = social.get("family", {})
+        friends = social.get("friends", {}).get("close_friends", [])
+        self.main_user = personal_data["full_name"].lower()
+
+        names = {}
+        # Family members and friends first, the later ones winning a shared name
+        for relation, member in family.items():
+            names[member["name"].lower()] = relation
+        for friend in friends:
+            names[friend["name"].lower()] = "friend"
+        # Grandchildren only where no one closer has the same name
+        for relation, member in family.items():
+            for grandchild in member.get("children", []):
+                names.setdefault(grandchild["name"].lower(), relation)
+        # Nicknames never shadow a name
+        for relation, member in family.items():
+            if member.get("nickname"):
+                names.setdefault(member["nickname"].lower(), relation)
+        for friend in friends:
+            if friend.get("nickname"):
+                names.setdefault(friend["nickname"].lower(), "friend")
+        # The profile owner has no relationship to themselves
+        names.pop(self.main_user, None)
+        if personal_data.get("nickname"):
+            names.pop(personal_data["nickname"].lower(), None)
+        self.names = names
+
+        self.kinship = {}
+        for relation in family:
+            self.kinship[relation.lower()] = relation
+            self.kinship.setdefault(canonical_kinship(relation), relation)
+        # Lowercase names and nicknames of the family, for recognizing the diary's writer
+        self.family_names = {member["name"].lower() for member in family.values()}
+        self.family_names.update(member["nickname"].lower() for member in family.values() if member.get("nickname"))
+        self._gazetteer = None
+        print(f"DEBUG: Relationship index compiled with {len(self.names)} names and {len(self.kinship)} kinship terms")
+
+    def relationship_of(self, name):
+        """
+        The entity's relationship to the profile owner, or "Unknown".
+        """
+        name = name.lower()
+        relationship = self.names.get(name)
+        if relationship is None:
+            relationship = self.kinship.get(canonical_kinship(name), "Unknown")
+        return relationship
+
+    def is_family_member(self, name):
+        return name.lower() in self.family_names
+
+    def gazetteer(self, nlp):
+        """
+        A spaCy `PhraseMatcher` for the relation words and this profile's known people,
+        compiled on first use in the process that runs the spaCy pipeline.
+        """
+        if self._gazetteer is None:
+            self._gazetteer = build_gazetteer(nlp, self.names)
+        return self._gazetteer
+
+
+# Compiled indexes of recently seen profiles, per process
+_relationship_indexes = OrderedDict()  # profile id -> (fingerprint, RelationshipIndex)
+_relationship_indexes_lock = threading.Lock()
+
+def profile_fingerprint(personal_data):
+    # Hash of the fields the index is compiled from, so a changed profile is recompiled
+    relevant = {key: personal_data.get(key) for key in ("full_name", "nickname", "social_interactions")}
+    return hashlib.sha256(json.dumps(relevant, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def get_relationship_index(personal_data):
+    """
+    The profile's compiled relationship index, cached by profile id and recompiled
+    when the profile's names or relationships change.
+    """
+    fingerprint = profile_fingerprint(personal_data)
+    key = personal_data.get("id")
+    if key is None:
+        key = fingerprint
+    with _relationship_indexes_lock:
+        cached = _relationship_indexes.get(key)
+        if cached is not None and cached[0] == fingerprint:
+            _relationship_indexes.move_to_end(key)
+            return cached[1]
+    index = RelationshipIndex(personal_data)
+    with _relationship_indexes_lock:
+        _relationship_indexes[key] = (fingerprint, index)
+        _relationship_indexes.move_to_end(key)
+        while len(_relationship_indexes) > NLP_RELATIONSHIP_CACHE_SIZE:
+            _relationship_indexes.popitem(last=False)
+    return index
+
+# ----------------------------
+# Gazetteer: Relation Words and Known People
+# ----------------------------
+KINSHIP = "KINSHIP"
+KNOWN_PERSON = "KNOWN_PERSON"
+# Determiners that make a relation word someone of the writer's ("my amma", "our son")
+POSSESSIVE_DETERMINERS = {"my", "our"}
+
+def build_gazetteer(nlp, known_names):
+    from spacy.matcher import PhraseMatcher
+    # Case-insensitive; the patterns only need the tokenizer
+    matcher = PhraseMatcher(nlp.vocab, attr="LOWER")
+    matcher.add(KNOWN_PERSON, list(nlp.tokenizer.pipe(known_names)))
+    matcher.add(KINSHIP, list(nlp.tokenizer.pipe(kinship_terms)))
+    print(f"DEBUG: Gazetteer compiled with {len(known_names)} known names and {len(kinship_terms)} relation words")
+    return matcher
+
+def find_mentions(doc, index):
+    """
+    Find every relation word and known person of the profile in one pass over the doc.
+
+    Overlapping matches keep the longest, and a known name wins over a relation word
+    spelled the same (a daughter named Anna is not "brother").
+
+    Returns:
+    - list: Mentions in text order, as dicts with `text`, `label` (`KNOWN_PERSON` or
+      `KINSHIP`) and `start`/`end` character offsets.
+    """
+    from spacy.util import filter_spans
+    matcher = index.gazetteer(registry.get("spacy"))
+    spans = matcher(doc, as_spans=True)
+    # filter_spans keeps the first of equally long spans
+    spans.sort(key=lambda span: span.label_ != KNOWN_PERSON)
+    mentions = [
+        {"text": span.text, "label": span.label_, "start": span.start_char, "end": span.end_char}
+        for span in sorted(filter_spans(spans), key=lambda span: span.start)
+    ]
+    print("DEBUG: Gazetteer mentions:", [(mention["text"], mention["label"]) for mention in mentions])
+    return mentions
+
+# ----------------------------
+# Stage Timings
+# ----------------------------
+class StageTimer:
+    """
+    Times the stages of annotations, summing repeated stages over several entries.
+    Timers run in the worker processes, so the service records their `timings_ms`
+    in its metrics (see `record_stage_timings` in main.py).
+    """
+    def __init__(self):
+        self.timings_ms = {}
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            self.timings_ms[name] = round(self.timings_ms.get(name, 0.0) + seconds * 1000, 2)
+
+# ----------------------------
+# NLP Extraction Functions
+# ----------------------------
+# All stages read the same spaCy doc of the original diary entry, parsed once per annotation
+def parse_diary(text):
+    print("DEBUG: Parsing diary entry with spaCy")
+    return registry.get("spacy")(text)
+
+def has_possessive(doc, mention):
+    # "my amma", "our son", "Ravi's teacher": a possessive attached to the word, or "my"/"our" right before it
+    span = doc.char_span(mention["start"], mention["end"])
+    if span is None:
+        return False
+    if any(child.dep_ == "poss" for child in span.root.children):
+        return True
+    return span.start > 0 and doc[span.start - 1].lower_ in POSSESSIVE_DETERMINERS
+
+def names_person(doc, mention, index=None):
+    """
+    Whether a gazetteer mention stands for a person: a known person of the profile, a
+    relation word the profile lists (its `son` when it has one), or a relation word with
+    a possessive ("my friend"). A bare "friend" or "teacher", or a word that is also a
+    name elsewhere ("Anna", "Nana"), is only a cue about a relationship.
+    """
+    if mention["label"] == KNOWN_PERSON:
+        return True
+    if index is not None:
+        term = mention["text"].lower()
+        if term in index.kinship or canonical_kinship(term) in index.kinship:
+            return True
+    return has_possessive(doc, mention)
+
+def extract_persons(doc, mentions=(), index=None):
+    """
+    spaCy's `PERSON` entities, plus the gazetteer's mentions that no entity covers and
+    that name a person (see `names_person`), in text order, as dicts with `text` and
+    `start`/`end` character offsets.
+
+    Returns:
+    - (persons, relation_cues): The persons, and the other uncovered relation words as
+      dicts with `text`, canonical `relation` and `start`/`end` character offsets.
+    """
+    entities = [ent for ent in doc.ents if ent.label_ == "PERSON"]
+    persons = [{"text": ent.text, "start": ent.start_char, "end": ent.end_char} for ent in entities]
+    relation_cues = []
+    for mention in mentions:
+        if any(ent.start_char < mention["end"] and mention["start"] < ent.end_char for ent in entities):
+            continue
+        if names_person(doc, mention, index):
+            persons.append({"text": mention["text"], "start": mention["start"], "end": mention["end"]})
+        else:
+            relation_cues.append({
+                "text": mention["text"],
+                "relation": canonical_kinship(mention["text"]),
+                "start": mention["start"],
+                "end": mention["end"],
+            })
+    persons.sort(key=lambda person: person["start"])
+    print("DEBUG: Persons extracted:", [person["text"] for person in persons])
+    print("DEBUG: Relation cues:", [cue["text"] for cue in relation_cues])
+    return persons, relation_cues
+
+def extract_locations(doc, stanza_doc=None):
+    if NLP_USE_STANZA:
+        stanza_doc = stanza_doc or registry.get("stanza")(doc.text)
+        locations = [ent.text for sentence in stanza_doc.sentences for ent in sentence.ents if ent.type in ["GPE", "LOC", "LOCATION"]]
+    else:
+        locations = [ent.text for ent in doc.ents if ent.label_ in ("GPE", "LOC")]
+    print("DEBUG: Locations extracted:", locations)
+    return locations
+
+def resolve_coreferences(doc):
+    print("DEBUG: Resolving coreferences in text")
+    mentions = {token.text.lower(): token.head.text for token in doc if token.dep_ in ("nsubj", "dobj", "pobj")}
+    # One pass over the tokens, replacing whole pronoun tokens only
+    parts = []
+    for token in doc:
+        replacement = mentions.get(token.lower_) if token.pos_ == "PRON" else None
+        if replacement is not None:
+            print(f"DEBUG: Replaced '{token.text}' with '{replacement}'")
+            parts.append(replacement + token.whitespace_)
+        else:
+            parts.append(token.text_with_ws)
+    text = "".join(parts)
+    print("DEBUG: Coreferences resolved. Resulting text:", text)
+    return text
+
+# ----------------------------
+# Sentences and Span Offsets
+# ----------------------------
+# Annotations point into the diary text with character offsets and the index of their
+# sentence, instead of carrying a copy of the text; `annotation_context` rebuilds the
+# sentence when it is needed.
+def sentence_offsets(doc):
+    """
+    `[start, end]` character offsets of each sentence, or of the whole text when the
+    pipeline does not set sentence boundaries.
+    """
+    if doc.has_annotation("SENT_START"):
+        return [[sent.start_char, sent.end_char] for sent in doc.sents]
+    return [[0, len(doc.text)]] if doc.text else []
+
+def sentence_index(sentences, start):
+    # Index of the sentence containing the character offset
+    return max(0, bisect.bisect_right([sentence[0] for sentence in sentences], start) - 1) if sentences else None
+
+def compact_annotations(text, annotations, sentences):
+    """
+    Convert annotations with a `context` (as returned by the AI model, or stored before
+    span offsets) into `entity`, `relationship`, `start`, `end` and `sentence`, locating
+    each entity in the text. Repeated entities map to successive mentions.
+
+    Entities that do not appear in the text get no offsets and keep the context they came with.
+    """
+    # Searched case-insensitively in the text itself: lowercasing can change its length
+    # ("İ" becomes two characters), which would shift every offset after it
+    searched_from = {}
+    compacted = []
+    for annotation in annotations:
+        if not isinstance(annotation, dict):
+            continue
+        entity = str(annotation.get("entity") or "")
+        key = entity.lower()
+        match = None
+        if entity:
+            pattern = re.compile(re.escape(entity), re.IGNORECASE)
+            match = pattern.search(text, searched_from.get(key, 0))
+            if match is None and key in searched_from:
+                match = pattern.search(text)
+        compact = {"entity": entity, "relationship": annotation.get("relationship")}
+        if match is None:
+            compact.update(start=None, end=None, sentence=None)
+            if annotation.get("context"):
+                compact["context"] = annotation["context"]
+        else:
+            searched_from[key] = match.end()
+            compact.update(start=match.start(), end=match.end(), sentence=sentence_index(sentences, match.start()))
+        compacted.append(compact)
+    return compacted
+
+def annotation_context(text, sentences, annotation):
+    """
+    The sentence an annotation was found in, or the context it was stored with.
+    """
+    index = annotation.get("sentence")
+    if index is None or not sentences or index >= len(sentences):
+        return annotation.get("context")
+    start, end = sentences[index]
+    return text[start:end].strip()
+
+# ----------------------------
+# Helper to Extract Writer's Signature
+# ----------------------------
+def extract_writer_name(doc, mentions=()) -> str:
+    """
+    The writer's signature: the last non-empty line of the entry, narrowed to the
+    person named in it (e.g. "Love, Anna" gives "Anna"). People of the profile found by
+    the gazetteer come first, then the people spaCy recognized.
+    """
+    text = doc.text.rstrip()
+    if not text.strip():
+        return ""
+    line_start = text.rfind("\n") + 1
+    signature = text[line_start:].strip()
+    for mention in mentions:
+        if mention["label"] == KNOWN_PERSON and mention["start"] >= line_start:
+            return mention["text"]
+    for ent in doc.ents:
+        if ent.label_ == "PERSON" and ent.start_char >= line_start:
+            return ent.text
+    return signature
+
+# ----------------------------
+# Diary Annotation Pipeline
+# ----------------------------
+def annotate_diary(diary_entry, personal_data, timer=None, doc=None, stanza_doc=None):
+    print("DEBUG: Starting diary annotation")
+    timer = timer or StageTimer()
+    original_text = diary_entry
+
+    if doc is None:
+        with timer.stage("parse"):
+            doc = parse_diary(diary_entry)
+    with timer.stage("coreference"):
+        diary_entry = resolve_coreferences(doc)
+    with timer.stage("gazetteer"):
+        index = get_relationship_index(personal_data)
+        mentions = find_mentions(doc, index)
+    with timer.stage("writer"):
+        writer = extract_writer_name(doc, mentions)
+    print("DEBUG: Extracted writer name:", writer)
+    with timer.stage("persons"):
+        persons, relation_cues = extract_persons(doc, mentions, index)
+    with timer.stage("locations"):
+        locations = extract_locations(doc, stanza_doc)
+    print("DEBUG: Annotating the following persons:", persons)
+
+    with timer.stage("relationships"):
+        sentences = sentence_offsets(doc)
+        annotations = []
+
+        # Determine if the diary is written by a child of the profile
+        writer_is_child = index.is_family_member(writer)
+
+        for person in persons:
+            name = person["text"]
+            canonical_name = canonical_kinship(name)
+            relationship = index.relationship_of(name)
+            # If the writer is a child and the entity is a common relation word, update accordingly.
+            if writer_is_child and canonical_name in ["dad", "mom"]:
+                if canonical_name == "dad":
+                    relationship = "father"
+                elif canonical_name == "mom":
+                    relationship = "mother"
+            annotations.append({
+                "entity": name,
+                "relationship": relationship,
+                "start": person["start"],
+                "end": person["end"],
+                "sentence": sentence_index(sentences, person["start"])
+            })
+            print(f"DEBUG: Annotation added for '{name}' with relationship '{relationship}'")
+        for cue in relation_cues:
+            cue["sentence"] = sentence_index(sentences, cue["start"])
+
+    annotation_result = {
+        "original_text": original_text,
+        "resolved_text": diary_entry,
+        "sentences": sentences,
+        "annotations": annotations,
+        "relation_cues": relation_cues,
+        "locations": locations
+    }
+    print("DEBUG: Diary annotation completed:", json.dumps(annotation_result, indent=2))
+    print("DEBUG: Annotation stage timings (ms):", timer.timings_ms)
+    return annotation_result
+
+# ----------------------------
+# Bulk Annotation
+# ----------------------------
+def parse_stanza_batch(texts):
+    # One Stanza call over all entries, so its models run on whole batches
+    import stanza
+    return registry.get("stanza")([stanza.Document([], text=text) for text in texts])
+
+def annotate_diaries(diary_entries, personal_data, timer=None, n_process=None, batch_size=None):
+    """
+    Annotate many diary entries of one profile, parsing them with `nlp.pipe` in
+    batches spread over up to `n_process` processes.
+
+    Returns one annotation result per entry, in order.
+    """
+    timer = timer or StageTimer()
+    batch_size = batch_size or NLP_BULK_BATCH_SIZE
+    # Worker processes only pay off when each gets at least one full batch
+    n_process = max(1, min(n_process or NLP_BULK_PROCESSES, -(-len(diary_entries) // batch_size)))
+    print(f"DEBUG: Parsing {len(diary_entries)} diary entries with {n_process} processes, batch size {batch_size}")
+    with timer.stage("parse"):
+        docs = list(registry.get("spacy").pipe(diary_entries, n_process=n_process, batch_size=batch_size))
+        stanza_docs = parse_stanza_batch(diary_entries) if NLP_USE_STANZA else [None] * len(docs)
+    return [
+        annotate_diary(entry, personal_data, timer, doc=doc, stanza_doc=stanza_doc)
+        for entry, doc, stanza_doc in zip(diary_entries, docs, stanza_docs)
+    ]
+
+# ----------------------------
+# Story Embeddings
+# ----------------------------
+def embed_texts(texts, batch_size=None):
+    """
+    Sentence embeddings of the texts, in batches of `batch_size` per forward pass.
+
+    Embeddings are L2-normalized, so cosine distance and inner product rank them alike.
+    Returns lists of floats (cheap to send back from the worker processes), in order.
+    """
+    if not texts:
+        return []
+    embeddings = registry.get("sentence").encode(
+        list(texts),
+        batch_size=batch_size or NLP_EMBED_BATCH_SIZE,
+        normalize_embeddings=True,
+        convert_to_numpy=True,
+        show_progress_bar=False,
+    )
+    return embeddings.tolist()
+
+def embed_with_timings(texts):
+    timer = StageTimer()
+    with timer.stage("embed"):
+        embeddings = embed_texts(texts)
+    return embeddings, timer.timings_ms
+
+# ----------------------------
+# Worker Process Pool
+# ----------------------------
+# Set in each worker process by init_worker
+_startup_barrier = None
+
+def init_worker(startup_barrier):
+    # Runs once in each worker process: load its own copy of the models
+    global _startup_barrier
+    _startup_barrier = startup_barrier
+    registry.load_blocking()
+
+def worker_status():
+    # Waiting for the other workers keeps this worker from answering two of the startup calls
+    _startup_barrier.wait(timeout=NLP_WORKER_START_TIMEOUT)
+    return os.getpid(), registry.status()
+
+def annotate_with_timings(diary_entry, personal_data):
+    timer = StageTimer()
+    return annotate_diary(diary_entry, personal_data, timer), timer.timings_ms
+
+def annotate_many_with_timings(diary_entries, personal_data, n_process=1):
+    timer = StageTimer()
+    return annotate_diaries(diary_entries, personal_data, timer, n_process=n_process), timer.timings_ms
+
+def merge_timings(timings):
+    merged = {}
+    for stage_timings in timings:
+        for stage, ms in stage_timings.items():
+            merged[stage] = round(merged.get(stage, 0.0) + ms, 2)
+    return merged
+
+class NLPWorkerPool:
+    """
+    Runs annotations in worker processes, so spaCy/Stanza inference neither blocks the
+    service's event loop nor holds its GIL. Each worker loads its own models when it starts.
+
+    Args:
+    - processes (int): Number of worker processes.
+    """
+
+    def __init__(self, processes):
+        self.processes = processes
+        self._executor = None
+        self.workers = {}  # pid -> model status reported by the worker
+        self.startup_s = None
+        self.error = None
+        self.restarts = 0
+
+    def _create_executor(self):
+        # Spawned, not forked: the service process has threads (model loading, DB pool)
+        context = multiprocessing.get_context("spawn")
+        return ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=context,
+            initializer=init_worker,
+            initargs=(context.Barrier(self.processes),),
+        )
+
+    async def start(self):
+        """
+        Start the workers and wait until they have loaded their models.
+        """
+        started = time.perf_counter()
+        self._executor = self._create_executor()
+        loop = asyncio.get_running_loop()
+        try:
+            # One call per worker; each waits for its worker's models and for the other workers
+            statuses = await asyncio.gather(
+                *(loop.run_in_executor(self._executor, worker_status) for _ in range(self.processes))
+            )
+            self.workers = dict(statuses)
+        except Exception as exc:
+            self.error = f"{type(exc).__name__}: {exc}"
+        self.startup_s = round(time.perf_counter() - started, 3)
+        print(f"DEBUG: NLP worker pool started in {self.startup_s}s, ready: {self.ready}, error: {self.error}")
+
+    @property
+    def ready(self):
+        return (
+            self._executor is not None
+            and self.error is None
+            and bool(self.workers)
+            and all(status["ready"] for status in self.workers.values())
+        )
+
+    async def run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._executor, fn, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory): replace the pool for the next requests
+            print("DEBUG: NLP worker pool broken, restarting it")
+            self.restarts += 1
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._create_executor()
+            raise
+
+    async def annotate(self, diary_entry, personal_data):
+        """
+        Returns the annotation result and its stage timings.
+        """
+        return await self.run(annotate_with_timings, diary_entry, personal_data)
+
+    async def annotate_many(self, diary_entries, personal_data, batch_size=None):
+        """
+        Spread the entries over the workers in batches. Returns the results, in order,
+        and the stage timings summed over all batches.
+        """
+        batch_size = batch_size or NLP_BULK_BATCH_SIZE
+        batches = [diary_entries[start:start + batch_size] for start in range(0, len(diary_entries), batch_size)]
+        outcomes = await asyncio.gather(
+            *(self.run(annotate_many_with_timings, batch, personal_data) for batch in batches)
+        )
+        results = [result for batch_results, _ in outcomes for result in batch_results]
+        return results, merge_timings(timings for _, timings in outcomes)
+
+    async def embed(self, texts, batch_size=None):
+        """
+        Embed the texts, spread over the workers in batches. Returns the embeddings, in
+        order, and the stage timings summed over all batches.
+        """
+        batch_size = batch_size or NLP_EMBED_BATCH_SIZE
+        batches = [texts[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+        outcomes = await asyncio.gather(*(self.run(embed_with_timings, batch) for batch in batches))
+        embeddings = [embedding for batch_embeddings, _ in outcomes for embedding in batch_embeddings]
+        return embeddings, merge_timings(timings for _, timings in outcomes)
+
+    def status(self):
+        return {
+            "ready": self.ready,
+            "processes": self.processes,
+            "startup_s": self.startup_s,
+            "restarts": self.restarts,
+            "error": self.error,
+            "workers": self.workers,
+        }
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,98 @@
+"""
+Embed stored stories that have no embedding yet, so `/memory/search` finds them.
+
+Stories stored before embeddings (or whose embedding failed) have `stories.embedding`
+unset. This embeds their diary texts with the sentence model in batches and writes the
+embeddings back, one transaction per batch. Only rows without an embedding are touched,
+so the backfill can be stopped and run again.
+
+Inserting into the HNSW index row by row is much slower than building it once, so for a
+large backfill pass `--rebuild-index`: the index is dropped first and built over all
+embeddings at the end.
+
+    python backfill_embeddings.py
+    python backfill_embeddings.py --batch-size 512 --rebuild-index
+"""
+import sys
+import json
+import time
+import argparse
+
+
+def backfill(args):
+    # main creates the engine and adds the embedding column and its index
+    from main import NLP_HNSW_EF_CONSTRUCTION, NLP_HNSW_M, SessionLocal, Story, engine, ensure_schema
+    from models import registry
+    from annotation import embed_texts
+    from sqlalchemy import bindparam, text
+
+    ensure_schema()
+    # Loaded before the clock starts, so stories_per_sec is the embedding throughput
+    registry.get("sentence")
+    if args.rebuild_index:
+        with engine.begin() as conn:
+            conn.execute(text("DROP INDEX IF EXISTS ix_stories_embedding_hnsw"))
+        print("DEBUG: Dropped the HNSW index until the backfill is done", file=sys.stderr)
+
+    stories = Story.__table__
+    set_embedding = (
+        stories.update()
+        .where(stories.c.id == bindparam("story_id"))
+        .values(embedding=bindparam("story_embedding", type_=stories.c.embedding.type))
+    )
+    summary = {"stories": 0, "rebuild_index": args.rebuild_index}
+    started = time.perf_counter()
+    last_id = 0
+    db = SessionLocal()
+    try:
+        while True:
+            # Only the ids and texts: the other columns are not needed to embed
+            rows = (
+                db.query(Story.id, Story.diary_text)
+                .filter(Story.embedding.is_(None), Story.id > last_id)
+                .order_by(Story.id)
+                .limit(args.batch_size)
+                .all()
+            )
+            if not rows:
+                break
+            last_id = rows[-1].id
+            embeddings = embed_texts([row.diary_text for row in rows], args.batch_size)
+            db.execute(
+                set_embedding,
+                [{"story_id": row.id, "story_embedding": embedding} for row, embedding in zip(rows, embeddings)],
+            )
+            db.commit()
+            summary["stories"] += len(rows)
+            print(f"DEBUG: Embedded {summary['stories']} stories (up to id {last_id})", file=sys.stderr)
+    finally:
+        db.close()
+    summary["embed_s"] = round(time.perf_counter() - started, 3)
+
+    if args.rebuild_index:
+        index_started = time.perf_counter()
+        with engine.begin() as conn:
+            # The build is much faster when the graph fits in maintenance_work_mem
+            conn.execute(text(f"SET LOCAL maintenance_work_mem = '{args.maintenance_work_mem}'"))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_stories_embedding_hnsw ON stories "
+                f"USING hnsw (embedding vector_cosine_ops) WITH (m = {NLP_HNSW_M}, ef_construction = {NLP_HNSW_EF_CONSTRUCTION})"
+            ))
+        summary["index_build_s"] = round(time.perf_counter() - index_started, 3)
+    summary["elapsed_s"] = round(time.perf_counter() - started, 3)
+    summary["stories_per_sec"] = round(summary["stories"] / summary["embed_s"], 2) if summary["embed_s"] > 0 else None
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=256, help="Stories embedded and committed at once")
+    parser.add_argument("--rebuild-index", action="store_true", help="Drop the HNSW index and build it again at the end")
+    parser.add_argument("--maintenance-work-mem", default="1GB", help="Memory for building the index (with --rebuild-index)")
+    args = parser.parse_args()
+    print(json.dumps(backfill(args), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+Import many diary entries of one profile at once, e.g. when onboarding a user.
+
+Runs the same pipeline as `POST /annotate/bulk` in-process: batched spaCy parsing over
+a pool of worker processes (one per core by default), concurrent AI refinement and
+bulk inserts. Input files can be:
+
+- `.json`: a list of diary texts, or of objects with a `diary_entry` key
+- `.jsonl`: one diary text or object per line
+- anything else: plain text, entries separated by lines containing only `---`
+
+    python bulk_import.py --personal-id 3 diaries.json
+    python bulk_import.py --personal-id 3 --no-refine --processes 8 old_diaries/*.txt
+"""
+import os
+import sys
+import json
+import asyncio
+import argparse
+from pathlib import Path
+
+
+def _entry_text(item):
+    return item if isinstance(item, str) else item["diary_entry"]
+
+
+def read_entries(path: Path):
+    content = path.read_text(encoding="utf-8")
+    if path.suffix == ".json":
+        return [_entry_text(item) for item in json.loads(content)]
+    if path.suffix == ".jsonl":
+        return [_entry_text(json.loads(line)) for line in content.splitlines() if line.strip()]
+    entries, current = [], []
+    for line in content.splitlines():
+        if line.strip() == "---":
+            entries.append("\n".join(current))
+            current = []
+        else:
+            current.append(line)
+    entries.append("\n".join(current))
+    return [entry.strip() for entry in entries if entry.strip()]
+
+
+async def wait_until_ready():
+    import main
+    while not main.nlp_ready():
+        if main.nlp_pool is not None and main.nlp_pool.error:
+            raise RuntimeError(f"NLP workers failed to start: {main.nlp_pool.error}")
+        await asyncio.sleep(0.2)
+
+
+async def run(args):
+    # Read when main is imported: size the worker pool, and leave queued /annotate/ jobs to the service
+    os.environ["NLP_WORKERS"] = str(args.processes or os.cpu_count() or 1)
+    os.environ["NLP_SERVICE_RUNS_JOBS"] = "false"
+    from main import SessionLocal, app, bulk_annotate, fetch_personal_data, lifespan
+
+    diary_entries = [entry for path in args.files for entry in read_entries(Path(path))]
+    print(f"DEBUG: Read {len(diary_entries)} diary entries from {len(args.files)} files", file=sys.stderr)
+    # The app's lifespan opens the LM router and checks the schema, as when serving
+    async with lifespan(app):
+        await wait_until_ready()
+        personal_data = await fetch_personal_data(args.personal_id)
+        db = SessionLocal()
+        try:
+            return await bulk_annotate(
+                diary_entries,
+                personal_data,
+                db,
+                refine=args.refine,
+                lm_concurrency=args.lm_concurrency,
+            )
+        finally:
+            db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="+", help="Files with diary entries")
+    parser.add_argument("--personal-id", required=True, help="Profile the entries belong to")
+    parser.add_argument("--no-refine", dest="refine", action="store_false", help="Store NLP annotations without the AI model")
+    parser.add_argument("--processes", type=int, help="NLP worker processes (default: one per core)")
+    parser.add_argument("--lm-concurrency", type=int, help="AI refinement calls in flight (default NLP_BULK_LM_CONCURRENCY)")
+    parser.add_argument("--output", help="Write the per-entry results as JSON to this file")
+    args = parser.parse_args()
+
+    summary = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+    report = {key: value for key, value in summary.items() if key != "results"}
+    print(json.dumps(report, indent=2))
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
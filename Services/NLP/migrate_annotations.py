@@ -0,0 +1,80 @@
+"""
+Migrate stored stories to span-offset annotations.
+
+Stories stored before span offsets carry a copy of the (coreference-resolved) diary
+text in every annotation's `context`. This parses their diary texts with spaCy in
+batches, stores the sentence offsets in `stories.sentences` and rewrites each annotation
+as `entity`, `relationship`, `start`/`end` offsets and `sentence` index. Only rows
+without sentence offsets are touched, so the migration can be stopped and run again.
+
+    python migrate_annotations.py
+    python migrate_annotations.py --batch-size 500 --dry-run
+"""
+import sys
+import json
+import time
+import argparse
+
+
+def json_size(value):
+    return len(json.dumps(value)) if value is not None else 0
+
+
+def migrate(args):
+    # main creates the engine and adds the sentences column
+    from main import SessionLocal, Story, ensure_schema
+    from models import registry
+    from annotation import compact_annotations, sentence_offsets
+
+    ensure_schema()
+    nlp = registry.get("spacy")
+    summary = {"stories": 0, "annotations": 0, "annotations_bytes_before": 0, "annotations_bytes_after": 0}
+    started = time.perf_counter()
+    last_id = 0
+    db = SessionLocal()
+    try:
+        while True:
+            stories = (
+                db.query(Story)
+                .filter(Story.sentences.is_(None), Story.id > last_id)
+                .order_by(Story.id)
+                .limit(args.batch_size)
+                .all()
+            )
+            if not stories:
+                break
+            last_id = stories[-1].id
+            docs = nlp.pipe([story.diary_text for story in stories], batch_size=args.batch_size)
+            for story, doc in zip(stories, docs):
+                sentences = sentence_offsets(doc)
+                summary["stories"] += 1
+                if isinstance(story.annotations, list):
+                    annotations = compact_annotations(story.diary_text, story.annotations, sentences)
+                    summary["annotations"] += len(annotations)
+                    summary["annotations_bytes_before"] += json_size(story.annotations)
+                    summary["annotations_bytes_after"] += json_size(annotations)
+                    story.annotations = annotations
+                story.sentences = sentences
+            if args.dry_run:
+                db.rollback()
+            else:
+                db.commit()
+            print(f"DEBUG: Migrated {summary['stories']} stories (up to id {last_id})", file=sys.stderr)
+    finally:
+        db.close()
+    summary["dry_run"] = args.dry_run
+    summary["elapsed_s"] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=200, help="Stories parsed and committed at once")
+    parser.add_argument("--dry-run", action="store_true", help="Report the savings without writing them")
+    args = parser.parse_args()
+    print(json.dumps(migrate(args), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""
+Model loading for the NLP service.
+
+Models are registered with a loader and loaded on startup in parallel threads, from the
+local cache only (no network) unless `NLP_MODELS_OFFLINE=false`. Models listed in
+`NLP_LAZY_MODELS` are skipped on startup and loaded on first use instead. Each eagerly
+loaded model runs one warm-up inference, so the first request does not pay for
+allocation and JIT work. `registry.ready` is true once every eager model is loaded.
+
+Usage:
+
+    from models import registry
+
+    await registry.load()                   # on startup
+    nlp_spacy = registry.get("spacy")       # loads now if lazy and not loaded yet
+    registry.status()                       # per-model state and timings, for /ready
+"""
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+# ----------------------------
+# Configuration
+# ----------------------------
+NLP_MODELS_OFFLINE = os.getenv("NLP_MODELS_OFFLINE", "true").lower() in ("1", "true", "yes", "on")
+# Local model cache for Stanza and Hugging Face models (defaults of the libraries when unset)
+NLP_MODEL_DIR = os.getenv("NLP_MODEL_DIR")
+SPACY_MODEL = os.getenv("SPACY_MODEL", "en_core_web_sm")
+# Pipeline components no annotation stage reads (the lemmas), skipped on every parse
+SPACY_DISABLE = [name.strip() for name in os.getenv("SPACY_DISABLE", "lemmatizer").split(",") if name.strip()]
+# Stanza is only used for location extraction; without it spaCy's GPE/LOC entities are used
+NLP_USE_STANZA = os.getenv("NLP_USE_STANZA", "false").lower() in ("1", "true", "yes", "on")
+STANZA_PROCESSORS = os.getenv("STANZA_PROCESSORS", "tokenize,ner")
+SENTENCE_MODEL = os.getenv("SENTENCE_MODEL", "all-MiniLM-L6-v2")
+# Size of the sentence model's embeddings, the width of the stories.embedding column
+SENTENCE_EMBEDDING_DIM = int(os.getenv("SENTENCE_EMBEDDING_DIM", 384))
+# Models loaded on first use rather than on startup
+NLP_LAZY_MODELS = {name.strip() for name in os.getenv("NLP_LAZY_MODELS", "").split(",") if name.strip()}
+# Models loaded at once on startup
+NLP_MODEL_LOAD_WORKERS = int(os.getenv("NLP_MODEL_LOAD_WORKERS", 3))
+NLP_MODEL_WARMUP = os.getenv("NLP_MODEL_WARMUP", "true").lower() in ("1", "true", "yes", "on")
+
+WARMUP_TEXT = "Dear diary, today Anna and I walked along the lake in Geneva with Dad."
+
+if NLP_MODELS_OFFLINE:
+    # Read by huggingface_hub/transformers on import, so set before any loader runs
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+# ----------------------------
+# Loaders
+# ----------------------------
+def load_spacy():
+    import spacy
+    return spacy.load(SPACY_MODEL, disable=SPACY_DISABLE)
+
+def load_stanza():
+    import stanza
+    # download_method=None never touches the network; resources must already be in NLP_MODEL_DIR
+    download_method = None if NLP_MODELS_OFFLINE else stanza.DownloadMethod.REUSE_RESOURCES
+    kwargs = {"dir": NLP_MODEL_DIR} if NLP_MODEL_DIR else {}
+    return stanza.Pipeline(lang="en", processors=STANZA_PROCESSORS, download_method=download_method, **kwargs)
+
+def load_sentence_model():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(SENTENCE_MODEL, cache_folder=NLP_MODEL_DIR)
+
+def warm_up_pipeline(model):
+    model(WARMUP_TEXT)
+
+def warm_up_sentence_model(model):
+    model.encode([WARMUP_TEXT])
+
+# ----------------------------
+# Registry
+# ----------------------------
+class ModelEntry:
+    def __init__(self, name: str, loader: Callable[[], Any], warm_up: Optional[Callable[[Any], None]], lazy: bool):
+        self.name = name
+        self.loader = loader
+        self.warm_up = warm_up
+        self.lazy = lazy
+        self.model = None
+        self.state = "pending"  # pending, loading, ready, failed
+        self.error: Optional[str] = None
+        self.load_s: Optional[float] = None
+        self.warm_up_s: Optional[float] = None
+        self.lock = threading.Lock()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "lazy": self.lazy,
+            "load_s": self.load_s,
+            "warm_up_s": self.warm_up_s,
+            "error": self.error,
+        }
+
+
+class ModelRegistry:
+    """
+    Named models with their loaders, loaded once and shared by all requests.
+
+    Args:
+    - workers (int): Models loaded in parallel by `load()`.
+    - warm_up (bool): Run each model's warm-up inference after loading it.
+    """
+
+    def __init__(self, workers: int = NLP_MODEL_LOAD_WORKERS, warm_up: bool = NLP_MODEL_WARMUP):
+        self.workers = max(1, workers)
+        self.run_warm_up = warm_up
+        self._entries: Dict[str, ModelEntry] = {}
+        self.startup_s: Optional[float] = None
+
+    def register(self, name: str, loader: Callable[[], Any], warm_up: Optional[Callable[[Any], None]] = None, lazy: bool = False):
+        self._entries[name] = ModelEntry(name, loader, warm_up, lazy)
+
+    def _load(self, entry: ModelEntry):
+        # The lock makes concurrent first uses wait for a single load
+        with entry.lock:
+            if entry.state == "ready":
+                return entry.model
+            entry.state = "loading"
+            print(f"DEBUG: Loading model '{entry.name}'")
+            started = time.perf_counter()
+            try:
+                model = entry.loader()
+                entry.load_s = round(time.perf_counter() - started, 3)
+                if self.run_warm_up and entry.warm_up is not None:
+                    warm_started = time.perf_counter()
+                    entry.warm_up(model)
+                    entry.warm_up_s = round(time.perf_counter() - warm_started, 3)
+            except Exception as exc:
+                entry.state = "failed"
+                entry.error = f"{type(exc).__name__}: {exc}"
+                print(f"DEBUG: Loading model '{entry.name}' failed: {entry.error}")
+                raise
+            entry.model = model
+            entry.error = None
+            entry.state = "ready"
+            print(f"DEBUG: Model '{entry.name}' loaded in {entry.load_s}s (warm-up {entry.warm_up_s}s)")
+            return model
+
+    def get(self, name: str):
+        """
+        Return a loaded model, loading it first if needed (blocks until it is loaded).
+        """
+        entry = self._entries[name]
+        if entry.state == "ready":
+            return entry.model
+        return self._load(entry)
+
+    async def load(self):
+        """
+        Load all eager models in parallel threads. Failures are recorded in `status()`
+        rather than raised, so the service stays up and reports not ready.
+        """
+        started = time.perf_counter()
+        eager: List[ModelEntry] = [entry for entry in self._entries.values() if not entry.lazy]
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="model-load") as pool:
+            results = await asyncio.gather(
+                *(loop.run_in_executor(pool, self._load, entry) for entry in eager),
+                return_exceptions=True,
+            )
+        self.startup_s = round(time.perf_counter() - started, 3)
+        failed = [entry.name for entry, result in zip(eager, results) if isinstance(result, Exception)]
+        print(f"DEBUG: Models loaded in {self.startup_s}s with {self.workers} workers, failed: {failed}")
+
+    def load_blocking(self):
+        """
+        `load()` for code without an event loop, such as worker process initializers.
+        """
+        asyncio.run(self.load())
+
+    @property
+    def ready(self) -> bool:
+        return all(entry.state == "ready" for entry in self._entries.values() if not entry.lazy)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "startup_s": self.startup_s,
+            "offline": NLP_MODELS_OFFLINE,
+            "models": {name: entry.status() for name, entry in self._entries.items()},
+        }
+
+
+registry = ModelRegistry()
+registry.register("spacy", load_spacy, warm_up_pipeline, lazy="spacy" in NLP_LAZY_MODELS)
+if NLP_USE_STANZA:
+    registry.register("stanza", load_stanza, warm_up_pipeline, lazy="stanza" in NLP_LAZY_MODELS)
+registry.register("sentence", load_sentence_model, warm_up_sentence_model, lazy="sentence" in NLP_LAZY_MODELS)
+
+# ----------------------------
+# Cache setup
+# ----------------------------
+def download_models():
+    """
+    Fill the local model cache once, so the service can start offline.
+    Stanza models are only downloaded when `NLP_USE_STANZA` is set.
+    """
+    # This is the one step that needs the network
+    os.environ.pop("HF_HUB_OFFLINE", None)
+    os.environ.pop("TRANSFORMERS_OFFLINE", None)
+    import spacy.cli
+    from sentence_transformers import SentenceTransformer
+
+    print(f"DEBUG: Downloading spaCy model '{SPACY_MODEL}'")
+    spacy.cli.download(SPACY_MODEL)
+    if NLP_USE_STANZA:
+        import stanza
+        print(f"DEBUG: Downloading Stanza English models ({STANZA_PROCESSORS})")
+        kwargs = {"model_dir": NLP_MODEL_DIR} if NLP_MODEL_DIR else {}
+        stanza.download("en", processors=STANZA_PROCESSORS, **kwargs)
+    print(f"DEBUG: Downloading SentenceTransformer model '{SENTENCE_MODEL}'")
+    SentenceTransformer(SENTENCE_MODEL, cache_folder=NLP_MODEL_DIR)
+    print("DEBUG: Model cache ready")
+
+
+if __name__ == "__main__":
+    download_models()
@@ -0,0 +1,48 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+# annotation imports the shared common package
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+
+from annotation import annotation_context, compact_annotations
+
+
+def spans(text, annotations):
+    return [text[annotation["start"]:annotation["end"]] for annotation in annotations if annotation["start"] is not None]
+
+
+def test_offsets_after_characters_that_lowercase_longer():
+    # "İ".lower() is two characters, which used to shift every offset after it
+    text = "İstanbul'da Ayşe ile buluştuk. Sonra Ayşe ve Mehmet çay içti."
+    sentences = [[0, 30], [31, len(text)]]
+    annotations = compact_annotations(text, [
+        {"entity": "Ayşe", "relationship": "friend"},
+        {"entity": "ayşe", "relationship": "friend"},
+        {"entity": "Mehmet", "relationship": "son"},
+    ], sentences)
+    assert spans(text, annotations) == ["Ayşe", "Ayşe", "Mehmet"]
+    assert [annotation["sentence"] for annotation in annotations] == [0, 1, 1]
+    assert annotation_context(text, sentences, annotations[2]) == "Sonra Ayşe ve Mehmet çay içti."
+
+
+def test_entities_match_case_insensitively_and_successively():
+    text = "Nani called. Later NANI and Rahul (the son) came."
+    annotations = compact_annotations(text, [
+        {"entity": "nani", "relationship": "grandmother"},
+        {"entity": "Nani", "relationship": "grandmother"},
+        {"entity": "Nani", "relationship": "grandmother"},
+        {"entity": "Rahul (the son)", "relationship": "son"},
+    ], [[0, 12], [13, len(text)]])
+    assert [annotation["start"] for annotation in annotations] == [0, 19, 0, 28]
+    assert spans(text, annotations)[3] == "Rahul (the son)"
+
+
+def test_missing_entity_keeps_its_context():
+    annotations = compact_annotations("Dad smiled.", [
+        {"entity": "Meera", "relationship": "friend", "context": "Meera waved."},
+        "not an annotation",
+    ], [[0, 11]])
+    assert annotations == [
+        {"entity": "Meera", "relationship": "friend", "start": None, "end": None, "sentence": None, "context": "Meera waved."}
+    ]
@@ -0,0 +1,50 @@
+"""
+Process queued `/annotate/` jobs outside the API service.
+
+Each worker claims jobs from the `annotation_jobs` table with `FOR UPDATE SKIP LOCKED`,
+runs them through the same pipeline as the service (NLP worker processes, AI refinement)
+and stores their stories. Run as many as the NLP and LM capacity allows, on any host that
+reaches the database; set `NLP_SERVICE_RUNS_JOBS=false` on the API service to leave all
+jobs to them.
+
+    python worker.py
+    python worker.py --concurrency 8 --processes 4
+"""
+import os
+import sys
+import signal
+import asyncio
+import argparse
+
+
+async def run(args):
+    # Read when main is imported: this process only runs jobs through run_job_worker below
+    os.environ["NLP_SERVICE_RUNS_JOBS"] = "false"
+    if args.processes is not None:
+        os.environ["NLP_WORKERS"] = str(args.processes)
+    from main import NLP_JOB_CONCURRENCY, app, lifespan, run_job_worker
+
+    worker = asyncio.current_task()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, worker.cancel)
+    # The app's lifespan starts the NLP workers and the LM router, as when serving
+    async with lifespan(app):
+        try:
+            await run_job_worker(args.concurrency or NLP_JOB_CONCURRENCY, args.worker_id)
+        except asyncio.CancelledError:
+            print("DEBUG: Worker stopped; jobs it had not finished are back in the queue", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, help="Jobs processed at once (default NLP_JOB_CONCURRENCY)")
+    parser.add_argument("--processes", type=int, help="NLP worker processes (default NLP_WORKERS)")
+    parser.add_argument("--worker-id", help="Name recorded on claimed jobs (default host:pid)")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
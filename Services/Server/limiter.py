@@ -0,0 +1,250 @@
+import math
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamUnavailable(HTTPException):
+    """
+    Raised instead of calling an upstream when it is overloaded or its circuit is open.
+    Returned to the client as a 503 with a `Retry-After` header.
+    """
+
+    def __init__(self, upstream: str, reason: str, retry_after: float):
+        self.upstream = upstream
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(
+            status_code=503,
+            detail=f"Upstream '{upstream}' unavailable: {reason}",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+
+class AIMDLimiter:
+    """
+    Adaptive concurrency limit using additive increase / multiplicative decrease.
+
+    Every successful call raises the limit by 1/limit (about +1 per limit's worth of calls);
+    a failed, timed-out or too-slow call multiplies it by `backoff`. Calls that were already
+    running when the limit was last cut do not cut it again, so a burst of slow calls backs
+    off once instead of once per call. Callers over the limit wait in a bounded FIFO queue
+    and are rejected when it is full or the wait is too long.
+
+    Args:
+    - name (str): Upstream name, used in errors.
+    - initial (int): Starting concurrency limit.
+    - min_limit (int): Lowest limit the backoff can reach.
+    - max_limit (int): Highest limit the increase can reach.
+    - max_queue (int): Callers allowed to wait for a slot.
+    - queue_timeout (float): Seconds a caller may wait before being rejected.
+    - latency_target (float): Calls slower than this (seconds) count as congestion; 0 disables.
+    - backoff (float): Factor applied to the limit on congestion.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial: int,
+        min_limit: int,
+        max_limit: int,
+        max_queue: int,
+        queue_timeout: float,
+        latency_target: float = 0.0,
+        backoff: float = 0.7,
+    ):
+        self.name = name
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.in_flight = 0
+        self.rejected = 0
+        self.backoffs = 0
+        self._backed_off_at = float("-inf")
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for waiter in self._waiters if not waiter.done())
+
+    def _has_capacity(self) -> bool:
+        return self.in_flight < max(1, int(self.limit))
+
+    async def acquire(self):
+        if self._has_capacity() and not self.waiting:
+            self.in_flight += 1
+            return
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise UpstreamUnavailable(self.name, "too many requests waiting", self.queue_timeout)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise UpstreamUnavailable(self.name, "timed out waiting for capacity", self.queue_timeout)
+        except asyncio.CancelledError:
+            # The slot may have been handed over just before the caller went away
+            if waiter.done() and not waiter.cancelled():
+                self._release_slot()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def release(self, failed: bool, latency: float, started: Optional[float] = None):
+        """
+        Give the slot back and adapt the limit to the call's outcome.
+
+        Args:
+        - failed (bool): Whether the call failed (timeout, connection error, 5xx).
+        - latency (float): Seconds the upstream took to answer, compared to `latency_target`.
+        - started (float, optional): `time.monotonic()` when the call started; defaults to
+          now minus `latency`.
+        """
+        now = time.monotonic()
+        if started is None:
+            started = now - latency
+        if failed or (self.latency_target and latency > self.latency_target):
+            # Started before the last cut: that congestion was already accounted for
+            if started >= self._backed_off_at:
+                self.limit = max(float(self.min_limit), self.limit * self.backoff)
+                self.backoffs += 1
+                self._backed_off_at = now
+        else:
+            self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+        self._release_slot()
+
+    def _release_slot(self):
+        self.in_flight -= 1
+        # Hand freed capacity to waiters in arrival order
+        while self._waiters and self._has_capacity():
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "backoffs": self.backoffs,
+        }
+
+
+class CircuitBreaker:
+    """
+    Stops calls to an upstream after `failure_threshold` consecutive failures.
+
+    The circuit stays open for `reset_timeout` seconds, then lets a single trial call
+    through (half-open); its outcome closes the circuit or opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._trial_running = False
+
+    def before_call(self):
+        if self.state == self.OPEN:
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                raise UpstreamUnavailable(self.name, "circuit open after repeated failures", remaining)
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self._trial_running:
+                raise UpstreamUnavailable(self.name, "circuit half-open, trial call in progress", 1)
+            self._trial_running = True
+
+    def record(self, failed: bool):
+        self._trial_running = False
+        if not failed:
+            if self.state != self.CLOSED:
+                logger.info(f"Circuit for '{self.name}' closed")
+            self.state = self.CLOSED
+            self.failures = 0
+            return
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.trips += 1
+                logger.warning(f"Circuit for '{self.name}' opened after {self.failures} failures")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, object]:
+        return {"state": self.state, "consecutive_failures": self.failures, "trips": self.trips}
+
+
+class Permit:
+    """
+    A granted slot for one upstream call. Must be released exactly once.
+
+    The limiter judges the call by its latency up to `answered()` (the response headers)
+    when that was called: a streamed response keeps the slot while its body is relayed,
+    but a long, healthy stream does not count as a slow upstream.
+    """
+
+    def __init__(self, guard: "UpstreamGuard"):
+        self._guard = guard
+        self._started = time.monotonic()
+        self._latency: Optional[float] = None
+        self._released = False
+
+    def answered(self):
+        if self._latency is None:
+            self._latency = time.monotonic() - self._started
+
+    def release(self, failed: bool):
+        if self._released:
+            return
+        self._released = True
+        latency = self._latency if self._latency is not None else time.monotonic() - self._started
+        self._guard.limiter.release(failed, latency, self._started)
+        self._guard.breaker.record(failed)
+
+
+class UpstreamGuard:
+    """
+    Admission control for one upstream: circuit breaker first, then the adaptive limiter.
+    """
+
+    def __init__(self, limiter: AIMDLimiter, breaker: CircuitBreaker):
+        self.limiter = limiter
+        self.breaker = breaker
+
+    async def acquire(self) -> Permit:
+        self.breaker.before_call()
+        try:
+            await self.limiter.acquire()
+        except BaseException:
+            # Not admitted, so the call neither succeeded nor failed
+            self.breaker._trial_running = False
+            raise
+        return Permit(self)
+
+    def stats(self) -> Dict[str, object]:
+        return {"limiter": self.limiter.stats(), "circuit": self.breaker.stats()}
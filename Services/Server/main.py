@@ -1,16 +1,64 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
 import random
+import asyncio
 import logging
+from pathlib import Path
+from urllib.parse import quote
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional, Tuple
 import httpx
 from fastapi import FastAPI, HTTPException, Request, Form, UploadFile, File  , Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 import uvicorn
 
-app = FastAPI()
+# Shared modules live in Services/common
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common import metrics
+
+from upstreams import upstreams
+from story_pool import StoryPool, STORY_POOL_ENABLED
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# /story/voice: TTS calls run in parallel per story, and very short sentences are merged
+STORY_VOICE_TTS_CONCURRENCY = int(os.getenv("STORY_VOICE_TTS_CONCURRENCY", 2))
+STORY_VOICE_MIN_SENTENCE_CHARS = int(os.getenv("STORY_VOICE_MIN_SENTENCE_CHARS", 40))
+
+# /story?query=...: the story is told from one of the memories most relevant to the query
+STORY_MEMORY_SEARCH_K = int(os.getenv("STORY_MEMORY_SEARCH_K", 3))  # relevant memories to choose from
+STORY_MEMORY_MIN_SIMILARITY = float(os.getenv("STORY_MEMORY_MIN_SIMILARITY", 0.2))  # less similar ones are not relevant
+STORY_MEMORY_QUERY_MAX_CHARS = int(os.getenv("STORY_MEMORY_QUERY_MAX_CHARS", 1000))  # the sentence model reads no more
+
+# End of a sentence: terminal punctuation, optional closing quotes/brackets, then whitespace
+SENTENCE_END = re.compile(r"[.!?]+[\"'\u201d\u2019)\]]*\s+")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled, keep-alive client per upstream for the lifetime of the app
+    upstreams.start()
+    if STORY_POOL_ENABLED:
+        # Warm the story pool in the background so the first /story requests are hits
+        story_pool.admit(None)
+        story_pool.schedule_refill()
+    try:
+        yield
+    finally:
+        await story_pool.close()
+        await upstreams.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
+metrics.instrument(app, "server")
+
 # CORS configuration: Allow origins matching ports 5000 to 5600 on localhost.
 allowed_origin_regex = r"^http://localhost:(5[0-5]\d\d|5600)$"
 
@@ -27,41 +75,243 @@ async def analyze_interaction():
     # Placeholder for analyzing interactions (no implementation yet)
     return {"message": "This is the analyze-interaction endpoint"}
 
-@app.get("/story")
-async def get_story():
+@app.get("/upstreams/stats")
+async def get_upstream_stats():
+    # Connection pool statistics per upstream, for sizing the pool limits
+    return upstreams.stats()
+
+
+async def fetch_random_memory(profile_id: Optional[int] = None):
+    """
+    Fetch a random annotated memory from the NLP service, optionally limited to one profile.
+    """
+    params = {"profile_id": profile_id} if profile_id is not None else None
+    response = await upstreams.nlp.client.get("/memory/random", params=params)
+    response.raise_for_status()
+    return response.json()
+
+
+async def fetch_memory(memory_id: int):
+    """
+    Fetch one annotated memory from the NLP service by id.
+    """
+    response = await upstreams.nlp.client.get(f"/memory/{memory_id}")
+    response.raise_for_status()
+    return response.json()
+
+
+async def search_relevant_memories(query: str, profile_id: Optional[int] = None) -> List[dict]:
+    """
+    The memories most relevant to a query (such as the current chat turn), through the
+    NLP service's semantic search. Empty when none is similar enough (e.g. before the
+    stories are embedded) or the search is unavailable.
+    """
+    params = {"q": query[:STORY_MEMORY_QUERY_MAX_CHARS], "k": STORY_MEMORY_SEARCH_K}
+    if profile_id is not None:
+        params["profile_id"] = profile_id
     try:
-        # Step 1: Get the total number of stories
-        async with httpx.AsyncClient() as client:
-            response = await client.get("http://0.0.0.0:6060/memory/count")
-            response.raise_for_status()
-            total_stories = response.json().get("count")
-
-        # Select a random story ID
-        story_id = random.randint(1, total_stories)
-
-        # Fetch the story using the selected story ID
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"http://0.0.0.0:6060/memory/{story_id}")
-            response.raise_for_status()
-            story = response.json()
-
-        # Annotated story text
-        annotated_story = story.get("ai_enhanced_annotations").get("choices")[0].get("message").get("content")
-
-        # Clean the annotated story
-        annotated_story = annotated_story.replace("\n", " ").replace("\r", " ").replace("\t", " ").replace("  ", " ")
-
-        # Step 2: Send the annotated story for further processing
-        async with httpx.AsyncClient(timeout=60.0) as client:  # Increased timeout to 60 seconds
-            payload = {"diary_entry": annotated_story}
-            ai_enhanced_story_response = await client.post(
-                "http://0.0.0.0:7000/generate-story", json=payload
-            )
-            ai_enhanced_story_response.raise_for_status()
-
-        # Returning the enhanced story response as JSON
-        return ai_enhanced_story_response.json()
+        response = await upstreams.nlp.client.get("/memory/search", params=params)
+        response.raise_for_status()
+        # Stories imported without AI refinement have no annotated text to tell
+        matches = [
+            memory for memory in response.json()["results"]
+            if memory["similarity"] >= STORY_MEMORY_MIN_SIMILARITY and memory.get("ai_enhanced_annotations")
+        ]
+    except httpx.HTTPError as exc:
+        logger.warning(f"Memory search failed, using a random memory: {exc}")
+        return []
+    if not matches:
+        metrics.count("story_memory_random_fallback")
+    return matches
+
+
+async def fetch_relevant_memory(query: str, profile_id: Optional[int] = None):
+    """
+    Fetch one of the memories most relevant to a query, or a random memory when none is.
+    """
+    matches = await search_relevant_memories(query, profile_id)
+    if not matches:
+        return await fetch_random_memory(profile_id)
+    # Any of the closest memories will do; varying them keeps a topic from always retelling one story
+    return random.choice(matches)
+
+
+async def build_story_payload(profile_id: Optional[int] = None, query: Optional[str] = None):
+    """
+    Pick a memory relevant to `query`, or a random one without a query, and build the AI
+    service's `/generate-story` request body from it.
+    """
+    story = await (fetch_relevant_memory(query, profile_id) if query else fetch_random_memory(profile_id))
+    return memory_story_payload(story)
+
+
+def memory_story_payload(story: dict) -> dict:
+    """
+    The AI service's `/generate-story` request body for an annotated memory.
+    """
+    # Annotated story text; stories imported without AI refinement only have their stored text
+    ai_enhanced_annotations = story.get("ai_enhanced_annotations")
+    if ai_enhanced_annotations:
+        annotated_story = ai_enhanced_annotations.get("choices")[0].get("message").get("content")
+    else:
+        annotated_story = story.get("annotated_story") or story.get("diary_text") or ""
+
+    # Clean the annotated story
+    annotated_story = annotated_story.replace("\n", " ").replace("\r", " ").replace("\t", " ").replace("  ", " ")
+
+    return {"diary_entry": annotated_story}
+
+
+async def build_story(
+    profile_id: Optional[int] = None,
+    priority: str = "background",
+    query: Optional[str] = None,
+    fresh: bool = False,
+):
+    """
+    Pick a memory (relevant to `query`, or random) and turn it into a story through the AI service.
+    Used both for synchronous `/story` requests and for story pool refills; refills run at
+    background priority so they do not hold up chat in the AI service's LM queue.
+    `fresh` skips the AI service's story cache, so a new variant is generated.
+    """
+    return await generate_story(await build_story_payload(profile_id, query), priority, fresh)
+
+
+async def generate_story(payload: dict, priority: str = "background", fresh: bool = False):
+    """
+    Turn a `/generate-story` request body into a story through the AI service.
+    """
+    payload["priority"] = priority
+    payload["fresh"] = fresh
+
+    # Send the annotated story for further processing
+    ai_enhanced_story_response = await upstreams.ai.client.post("/generate-story", json=payload)
+    ai_enhanced_story_response.raise_for_status()
+    return ai_enhanced_story_response.json()
+
+
+async def open_stream(upstream, request: httpx.Request) -> httpx.Response:
+    """
+    Send a request to an upstream without reading the response body.
+    Raises `httpx.HTTPStatusError` (with the body read) if the upstream answers with an error.
+    """
+    response = await upstream.client.send(request, stream=True)
+    if response.is_error:
+        await response.aread()
+        await response.aclose()
+        response.raise_for_status()
+    return response
+
+
+def relay_stream(response: httpx.Response, media_type: str, kind: str, started: float, headers=None) -> StreamingResponse:
+    """
+    Relay an upstream response body to the client chunk by chunk, closing the upstream
+    response once the client has received everything (or disconnected).
+    """
+    async def body():
+        first_chunk = True
+        try:
+            async for chunk in response.aiter_raw():
+                if first_chunk:
+                    first_chunk = False
+                    logger.info(f"{kind}: first streamed bytes after {(time.perf_counter() - started) * 1000:.1f}ms")
+                yield chunk
+        finally:
+            await response.aclose()
+            logger.info(f"{kind}: stream finished after {(time.perf_counter() - started) * 1000:.1f}ms")
+
+    return StreamingResponse(body(), media_type=media_type, headers=headers)
+
+
+async def relay_event_stream(upstream, path: str, payload: dict, kind: str) -> StreamingResponse:
+    """
+    Forward a streaming request to an upstream and relay its server-sent events to the client
+    as they arrive, without buffering the whole response.
+    """
+    started = time.perf_counter()
+    response = await open_stream(upstream, upstream.client.build_request("POST", path, json=payload))
+    return relay_stream(
+        response,
+        "text/event-stream",
+        kind,
+        started,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def memory_pool_key(memory_id: int) -> Tuple[str, int]:
+    # Stories of one memory relevant to a query, next to the per-profile keys of random memories
+    return ("memory", memory_id)
+
+
+async def build_pooled_story(key=None):
+    # Pooled stories skip the AI service's story cache, or a pool could fill with copies of one story
+    if isinstance(key, tuple):
+        return await generate_story(memory_story_payload(await fetch_memory(key[1])), fresh=True)
+    return await build_story(key, fresh=True)
+
+
+async def take_or_build_story(key, build):
+    """
+    Serve a pre-generated story for a pool key if one is ready, otherwise generate one
+    synchronously with `build`. Either way the key is refilled in the background.
+    """
+    story = story_pool.take(key)
+    if story is None:
+        logger.info(f"Story pool miss for {key!r}, generating story synchronously")
+        story = await build()
+        # The key has a memory to tell: keep stories of it ready from now on
+        story_pool.admit(key)
+    story_pool.schedule_refill(key)
+    return story
+
+
+story_pool = StoryPool(build_pooled_story)
+metrics.track_queue("story_pool_ready", story_pool.ready_count)
+metrics.track_queue("story_pool_refilling", story_pool.pending_count)
+
+
+@app.get("/story/pool/stats")
+async def get_story_pool_stats():
+    # Hit rate of the pre-generated story pool versus synchronous generation
+    return {"enabled": STORY_POOL_ENABLED, **story_pool.stats()}
 
+
+@app.get("/story")
+async def get_story(profile_id: Optional[int] = None, stream: bool = False, query: Optional[str] = None):
+    # With a query (e.g. the current chat turn), the story is told from a memory relevant to it
+    try:
+        if stream:
+            # Stream the story tokens as they are generated, bypassing the pool
+            payload = await build_story_payload(profile_id, query)
+            payload["stream"] = True
+            payload["priority"] = "interactive"
+            return await relay_event_stream(upstreams.ai, "/generate-story", payload, "story")
+
+        if not STORY_POOL_ENABLED:
+            return await build_story(profile_id, priority="interactive", query=query)
+
+        if query:
+            matches = await search_relevant_memories(query, profile_id)
+            if matches:
+                # Stories of relevant memories are pooled per memory; prefer one that has a story ready
+                ready = [memory for memory in matches if story_pool.ready_for(memory_pool_key(memory["id"]))]
+                memory = random.choice(ready or matches)
+                return await take_or_build_story(
+                    memory_pool_key(memory["id"]),
+                    lambda: generate_story(memory_story_payload(memory), priority="interactive"),
+                )
+            # Nothing relevant: a random memory, like without a query
+
+        # Serve a pre-generated story if one is ready, otherwise generate synchronously.
+        # Random memories are pooled per profile (None = memories of any profile).
+        return await take_or_build_story(
+            profile_id, lambda: build_story(profile_id, priority="interactive")
+        )
+
+    except HTTPException:
+        # Upstream overloaded or its circuit is open: already a 503 with Retry-After
+        raise
     except httpx.RequestError as exc:
         logger.error(f"Request error: {exc}")
         raise HTTPException(status_code=500, detail=f"Request error: {exc}")
@@ -80,6 +330,8 @@ async def get_story():
 async def get_chat(
     latest_msg: str = Form(...),  # The most recent message
     prev_msgs: list = Form(...),  # A list of previous messages for context
+    stream: bool = Form(False),  # Relay tokens as server-sent events
+    conversation_id: Optional[str] = Form(None),  # Lets the AI service reuse the conversation's summary
 ):
     try:
         logger.debug(f"Latest message received: {latest_msg}")
@@ -90,16 +342,24 @@ async def get_chat(
             "latest_msg": latest_msg,
             "prev_msgs": prev_msgs
         }
+        if conversation_id:
+            payload["conversation_id"] = conversation_id
+
+        if stream:
+            payload["stream"] = True
+            return await relay_event_stream(upstreams.ai, "/chat", payload, "chat")
 
         # Step 1: Send the latest message and previous messages to the chat service
-        async with httpx.AsyncClient(timeout=60.0) as client:  # Increased timeout to 60 seconds
-            response = await client.post("http://0.0.0.0:7000/chat", json=payload)
-            response.raise_for_status()
+        response = await upstreams.ai.client.post("/chat", json=payload)
+        response.raise_for_status()
 
         # Step 2: Returning the enhanced response from the chat service
         logger.debug("Received response from chat service")
         return response.json()
 
+    except HTTPException:
+        raise
+
     except httpx.RequestError as exc:
         logger.error(f"Request error occurred: {exc}")
         raise HTTPException(status_code=500, detail=f"Request error: {exc}")
@@ -132,25 +392,22 @@ async def get_voice(
 
         # Step 1: Send the received story text directly to the TTS service without refining it
         logger.debug(f"Sending story text to TTS service: {text[:100]}...")  # Log the first 100 chars
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            files = {
-                "text": (None, text),  # Directly use the received story text
-                "ref_audio": (ref_audio.filename, ref_audio.file, "audio/mpeg"),  # Reference audio file
-                "style": (None, style),  # Voice style
-                "language": (None, language),  # Language
-                "speed": (None, speed),  # Speed (adjust as needed)
-            }
-
-            response = await client.post(
-                "http://0.0.0.0:6080/synthesize",
-                files=files
-            )
-
-            response.raise_for_status()
+        files = {
+            "text": (None, text),  # Directly use the received story text
+            "ref_audio": (ref_audio.filename, ref_audio.file, "audio/mpeg"),  # Reference audio file
+            "style": (None, style),  # Voice style
+            "language": (None, language),  # Language
+            "speed": (None, speed),  # Speed (adjust as needed)
+        }
+
+        response = await upstreams.tts.client.post("/synthesize", files=files)
+        response.raise_for_status()
 
         logger.debug(f"Received audio data from TTS service")
         return {"audio_data": response.content}
 
+    except HTTPException:
+        raise
     except httpx.RequestError as exc:
         logger.error(f"Request error occurred: {exc}")
         if exc.request:
@@ -177,6 +434,237 @@ async def get_voice(
         raise HTTPException(status_code=500, detail=f"Unexpected error: {exc}")
 
 
+@app.post("/voice/stream")
+async def stream_voice(request: Request):
+    """
+    Streaming variant of `/voice`. Accepts the same multipart form fields, but the upload is
+    forwarded to the TTS service as it arrives instead of being parsed and buffered, and the
+    synthesized audio is streamed back as binary with the TTS service's audio content type.
+    """
+    content_type = request.headers.get("content-type", "")
+    if not content_type.startswith("multipart/form-data"):
+        raise HTTPException(status_code=415, detail="Expected a multipart/form-data body")
+
+    try:
+        started = time.perf_counter()
+        # Pass the multipart body through untouched; the TTS service ignores the extra voice_type field
+        headers = {"Content-Type": content_type}
+        if "content-length" in request.headers:
+            headers["Content-Length"] = request.headers["content-length"]
+        upstream_request = upstreams.tts.client.build_request(
+            "POST", "/synthesize", content=request.stream(), headers=headers
+        )
+        response = await open_stream(upstreams.tts, upstream_request)
+
+        media_type = response.headers.get("content-type", "audio/wav")
+        relay_headers = {}
+        if "content-length" in response.headers:
+            relay_headers["Content-Length"] = response.headers["content-length"]
+        return relay_stream(response, media_type, "voice", started, headers=relay_headers)
+
+    except httpx.HTTPStatusError as exc:
+        logger.error(f"HTTP error occurred: {exc}")
+        logger.error(f"Response Body: {exc.response.text}")
+        raise HTTPException(status_code=exc.response.status_code, detail=f"HTTP error: {exc}")
+    except httpx.TimeoutException as exc:
+        logger.error(f"Timeout error: {exc}")
+        raise HTTPException(status_code=504, detail="Request timed out")
+    except httpx.RequestError as exc:
+        logger.error(f"Request error occurred: {exc}")
+        raise HTTPException(status_code=500, detail=f"Request error: {exc}")
+
+
+
+def split_sentences(text: str, min_chars: int = STORY_VOICE_MIN_SENTENCE_CHARS) -> Tuple[List[str], str]:
+    """
+    Cut the complete sentences off the front of `text`.
+
+    Args:
+    - text (str): Story text received so far.
+    - min_chars (int): Sentences shorter than this are joined with the following one.
+
+    Returns:
+    - (sentences, rest): The complete sentences, and the unfinished text to keep buffering.
+    """
+    sentences = []
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        sentence = text[start:match.end()].strip()
+        if len(sentence) >= min_chars:
+            sentences.append(sentence)
+            start = match.end()
+    return sentences, text[start:]
+
+
+async def iter_sse_tokens(response: httpx.Response) -> AsyncIterator[str]:
+    """
+    Yield the tokens of an AI service event stream until its `done` event.
+    Raises `RuntimeError` if the stream reports an error.
+    """
+    event = None
+    async for line in response.aiter_lines():
+        if line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data = json.loads(line[len("data:"):].strip())
+            if event == "error":
+                raise RuntimeError(data.get("detail", "story generation failed"))
+            if event == "done":
+                return
+            yield data.get("token", "")
+        elif not line:
+            event = None
+
+
+async def synthesize_sentence(text: str, ref_audio: Tuple[str, bytes, str], style: str, language: str, speed: str):
+    """
+    Synthesize one sentence with the TTS service. Returns the audio bytes and their content type.
+    """
+    files = {
+        "text": (None, text),
+        "ref_audio": ref_audio,
+        "style": (None, style),
+        "language": (None, language),
+        "speed": (None, speed),
+    }
+    response = await upstreams.tts.client.post("/synthesize", files=files)
+    response.raise_for_status()
+    return response.content, response.headers.get("content-type", "audio/wav")
+
+
+def multipart_part(boundary: str, content: bytes, content_type: str, headers: Optional[dict] = None) -> bytes:
+    """
+    One part of a `multipart/mixed` body: the boundary line, the part headers and the raw content.
+    Header values must be ASCII without line breaks.
+    """
+    lines = [f"--{boundary}", f"Content-Type: {content_type}", f"Content-Length: {len(content)}"]
+    lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("ascii") + content + b"\r\n"
+
+
+def json_part(boundary: str, data: dict) -> bytes:
+    return multipart_part(boundary, json.dumps(data).encode(), "application/json")
+
+
+@app.post("/story/voice")
+async def story_voice(
+    ref_audio: UploadFile = File(...),
+    profile_id: Optional[int] = Form(None),
+    style: str = Form("default"),
+    language: str = Form("English"),
+    speed: str = Form("1"),
+    query: Optional[str] = Form(None),  # Tell a memory relevant to this (e.g. the current chat turn)
+):
+    """
+    Generate a story and read it aloud in one request.
+
+    Story tokens are streamed from the AI service and cut into sentences as they arrive;
+    each finished sentence is sent to the TTS service straight away, so synthesis overlaps
+    with generation. The response is `multipart/mixed`: one binary audio part per sentence
+    in story order, with the sentence index and (percent-encoded) text in the part headers,
+    then a JSON part with `done`, the full `story` and timings. A failure mid-stream is
+    reported as a JSON part with `error`.
+    """
+    started = time.perf_counter()
+    try:
+        # The reference audio is read once and reused for every sentence
+        ref_audio_part = (ref_audio.filename, await ref_audio.read(), ref_audio.content_type or "audio/mpeg")
+
+        payload = await build_story_payload(profile_id, query)
+        payload["stream"] = True
+        payload["priority"] = "interactive"
+        story_response = await open_stream(
+            upstreams.ai, upstreams.ai.client.build_request("POST", "/generate-story", json=payload)
+        )
+
+    except HTTPException:
+        raise
+    except httpx.HTTPStatusError as exc:
+        logger.error(f"HTTP error occurred: {exc}")
+        raise HTTPException(status_code=exc.response.status_code, detail=f"HTTP error: {exc}")
+    except httpx.TimeoutException as exc:
+        logger.error(f"Timeout error: {exc}")
+        raise HTTPException(status_code=504, detail="Request timed out")
+    except httpx.RequestError as exc:
+        logger.error(f"Request error occurred: {exc}")
+        raise HTTPException(status_code=500, detail=f"Request error: {exc}")
+    except Exception as exc:
+        logger.error(f"Unexpected error: {exc}")
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {exc}")
+
+    tts_slots = asyncio.Semaphore(STORY_VOICE_TTS_CONCURRENCY)
+    # Synthesis tasks in story order; None marks the end of the story
+    pending: asyncio.Queue = asyncio.Queue()
+    sentences: List[str] = []
+
+    async def synthesize(text: str):
+        async with tts_slots:
+            return await synthesize_sentence(text, ref_audio_part, style, language, speed)
+
+    def submit(text: str):
+        sentences.append(text)
+        pending.put_nowait(asyncio.create_task(synthesize(text)))
+
+    async def read_story():
+        buffer = ""
+        try:
+            async for token in iter_sse_tokens(story_response):
+                buffer += token
+                complete, buffer = split_sentences(buffer)
+                for sentence in complete:
+                    submit(sentence)
+            if buffer.strip():
+                submit(buffer.strip())
+        finally:
+            await story_response.aclose()
+            pending.put_nowait(None)
+
+    boundary = uuid.uuid4().hex
+
+    async def body():
+        reader = asyncio.create_task(read_story())
+        index = 0
+        first_audio_ms = None
+        try:
+            while True:
+                task = await pending.get()
+                if task is None:
+                    break
+                audio, media_type = await task
+                if first_audio_ms is None:
+                    first_audio_ms = round((time.perf_counter() - started) * 1000, 1)
+                    logger.info(f"story/voice: first audio after {first_audio_ms}ms")
+                # Sent as is, without base64 inflating every sentence by a third
+                yield multipart_part(boundary, audio, media_type, {
+                    "X-Sentence-Index": index,
+                    "X-Sentence-Text": quote(sentences[index]),
+                })
+                index += 1
+            # Surface story generation errors that ended the stream early
+            await reader
+            yield json_part(boundary, {
+                "done": True,
+                "story": " ".join(sentences),
+                "sentences": index,
+                "first_audio_ms": first_audio_ms,
+                "total_ms": round((time.perf_counter() - started) * 1000, 1),
+            })
+        except Exception as exc:
+            logger.error(f"story/voice: stream failed: {exc}")
+            yield json_part(boundary, {"error": str(exc)})
+        finally:
+            reader.cancel()
+            while not pending.empty():
+                task = pending.get_nowait()
+                if task is not None:
+                    task.cancel()
+        yield f"--{boundary}--\r\n".encode("ascii")
+
+    return StreamingResponse(
+        body(), media_type=f"multipart/mixed; boundary={boundary}", headers={"X-Accel-Buffering": "no"}
+    )
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
 
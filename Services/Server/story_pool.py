@@ -0,0 +1,163 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional, Set, Tuple
+
+from common import metrics
+
+logger = logging.getLogger(__name__)
+
+# Pool configuration (override with environment variables)
+STORY_POOL_ENABLED = os.getenv("STORY_POOL_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+STORY_POOL_SIZE = int(os.getenv("STORY_POOL_SIZE", 3))  # Ready stories kept per pool key
+STORY_POOL_REFILL_CONCURRENCY = int(os.getenv("STORY_POOL_REFILL_CONCURRENCY", 2))  # Parallel generations
+STORY_POOL_MAX_AGE_SECONDS = float(os.getenv("STORY_POOL_MAX_AGE_SECONDS", 3600))  # Stories older than this are dropped
+STORY_POOL_MAX_KEYS = int(os.getenv("STORY_POOL_MAX_KEYS", 256))  # Least recently used keys beyond this are dropped
+
+
+class StoryPool:
+    """
+    Keeps a small number of pre-generated stories per key (e.g. per profile) so that
+    `/story` can answer from memory and refill the pool in the background.
+
+    Only admitted keys are refilled: callers admit a key once a story was generated for
+    it, so ids that do not exist never cost background generations. At most `max_keys`
+    keys are kept; the least recently used one is dropped, with its stories, beyond that.
+
+    Args:
+    - generate (Callable): Coroutine function that builds one story for a key.
+    - size (int): Number of ready stories to keep per key.
+    - refill_concurrency (int): Maximum number of generations running at once.
+    - max_age (float): Seconds after which a pooled story is considered stale.
+    - max_keys (int): Number of keys kept.
+    """
+
+    def __init__(
+        self,
+        generate: Callable[[Hashable], Awaitable[Dict[str, Any]]],
+        size: int = STORY_POOL_SIZE,
+        refill_concurrency: int = STORY_POOL_REFILL_CONCURRENCY,
+        max_age: float = STORY_POOL_MAX_AGE_SECONDS,
+        max_keys: int = STORY_POOL_MAX_KEYS,
+    ):
+        self._generate = generate
+        self.size = size
+        self.max_age = max_age
+        self.max_keys = max(1, max_keys)
+        self._semaphore = asyncio.Semaphore(max(1, refill_concurrency))
+        # Admitted keys, least recently used first
+        self._stories: "OrderedDict[Hashable, Deque[Tuple[float, Dict[str, Any]]]]" = OrderedDict()
+        self._pending: Dict[Hashable, int] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+        # Counters for hit rate vs synchronous fallback
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.refills = 0
+        self.refill_errors = 0
+        self.evicted = 0
+
+    def admit(self, key: Hashable = None):
+        """
+        Let the key be refilled, e.g. once a story was generated for it. Drops the least
+        recently used keys beyond `max_keys`.
+        """
+        if key in self._stories:
+            self._stories.move_to_end(key)
+            return
+        self._stories[key] = deque()
+        while len(self._stories) > self.max_keys:
+            evicted, _ = self._stories.popitem(last=False)
+            self.evicted += 1
+            metrics.count("story_pool_evicted")
+            logger.info(f"Story pool dropped least recently used key {evicted!r}")
+
+    def take(self, key: Hashable = None) -> Optional[Dict[str, Any]]:
+        """
+        Pop a fresh story for the key, dropping stale ones. Returns None on a miss.
+        """
+        stories = self._stories.get(key)
+        if stories is not None:
+            self._stories.move_to_end(key)
+        now = time.monotonic()
+        while stories:
+            created, story = stories.popleft()
+            if now - created <= self.max_age:
+                self.hits += 1
+                metrics.count("story_pool_hit")
+                return story
+            self.stale += 1
+            metrics.count("story_pool_stale")
+        self.misses += 1
+        metrics.count("story_pool_miss")
+        return None
+
+    def schedule_refill(self, key: Hashable = None):
+        """
+        Start background generations until the key has `size` stories ready or pending.
+        Keys that were not admitted (or were dropped since) are not refilled.
+        """
+        if key not in self._stories:
+            return
+        missing = self.size - len(self._stories.get(key, ())) - self._pending.get(key, 0)
+        for _ in range(missing):
+            self._pending[key] = self._pending.get(key, 0) + 1
+            task = asyncio.create_task(self._refill_one(key))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _refill_one(self, key: Hashable):
+        try:
+            async with self._semaphore:
+                story = await self._generate(key)
+            # The key may have been dropped while the story was generated
+            if key in self._stories:
+                self._stories[key].append((time.monotonic(), story))
+            self.refills += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            self.refill_errors += 1
+            metrics.count("story_pool_refill_error")
+            logger.error(f"Story pool refill failed for key {key!r}: {exc}")
+        finally:
+            self._pending[key] -= 1
+            if not self._pending[key]:
+                del self._pending[key]
+
+    def ready_for(self, key: Hashable = None) -> int:
+        """Number of stories pooled for one key (some may turn out stale when taken)."""
+        return len(self._stories.get(key, ()))
+
+    def ready_count(self) -> int:
+        return sum(len(stories) for stories in self._stories.values())
+
+    def pending_count(self) -> int:
+        return sum(self._pending.values())
+
+    def stats(self) -> Dict[str, Any]:
+        served = self.hits + self.misses
+        return {
+            "size": self.size,
+            "max_age_seconds": self.max_age,
+            "keys": len(self._stories),
+            "max_keys": self.max_keys,
+            "evicted": self.evicted,
+            "ready": {str(key): len(stories) for key, stories in self._stories.items()},
+            "pending": {str(key): count for key, count in self._pending.items() if count},
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / served if served else 0.0,
+            "stale_dropped": self.stale,
+            "refills": self.refills,
+            "refill_errors": self.refill_errors,
+        }
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
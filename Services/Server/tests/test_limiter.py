@@ -0,0 +1,250 @@
+import sys
+import time
+import asyncio
+from pathlib import Path
+
+import httpx
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+# upstreams imports the shared common package
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+
+from limiter import AIMDLimiter, CircuitBreaker, UpstreamGuard, UpstreamUnavailable
+from upstreams import GuardedTransport
+
+
+def make_limiter(**overrides) -> AIMDLimiter:
+    settings = dict(initial=2, min_limit=1, max_limit=8, max_queue=1, queue_timeout=0.05)
+    settings.update(overrides)
+    return AIMDLimiter("test", **settings)
+
+
+def make_guard(limiter: AIMDLimiter = None, failure_threshold: int = 2, reset_timeout: float = 10.0) -> UpstreamGuard:
+    return UpstreamGuard(limiter or make_limiter(), CircuitBreaker("test", failure_threshold, reset_timeout))
+
+
+def test_queue_full_rejects_immediately():
+    async def scenario():
+        limiter = make_limiter(initial=1, queue_timeout=1.0)
+        await limiter.acquire()
+        waiting = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(UpstreamUnavailable) as error:
+            await limiter.acquire()
+        assert error.value.status_code == 503
+        assert "too many requests waiting" in error.value.detail
+        # The queued caller gets the slot once it is released
+        limiter.release(failed=False, latency=0.01)
+        await waiting
+        assert limiter.in_flight == 1 and limiter.rejected == 1
+
+    asyncio.run(scenario())
+
+
+def test_queue_timeout_rejects_waiter():
+    async def scenario():
+        limiter = make_limiter(initial=1, queue_timeout=0.02)
+        await limiter.acquire()
+        with pytest.raises(UpstreamUnavailable) as error:
+            await limiter.acquire()
+        assert "timed out waiting for capacity" in error.value.detail
+        assert error.value.headers["Retry-After"] == "1"
+        assert limiter.waiting == 0 and limiter.in_flight == 1
+
+    asyncio.run(scenario())
+
+
+def test_failure_decreases_limit_multiplicatively():
+    async def scenario():
+        limiter = make_limiter(initial=8, backoff=0.5)
+        await limiter.acquire()
+        limiter.release(failed=True, latency=0.01)
+        assert limiter.limit == 4.0
+        # Never below the minimum
+        limiter._backed_off_at = float("-inf")
+        limiter.limit = 1.5
+        await limiter.acquire()
+        limiter.release(failed=True, latency=0.01)
+        assert limiter.limit == 1.0
+
+    asyncio.run(scenario())
+
+
+def test_success_increases_limit_additively():
+    async def scenario():
+        limiter = make_limiter(initial=4)
+        for _ in range(4):
+            await limiter.acquire()
+            limiter.release(failed=False, latency=0.01)
+        assert 4.9 < limiter.limit < 5.0
+
+    asyncio.run(scenario())
+
+
+def test_slow_success_decreases_limit():
+    async def scenario():
+        limiter = make_limiter(initial=4, latency_target=0.5, backoff=0.5)
+        await limiter.acquire()
+        limiter.release(failed=False, latency=0.1)
+        assert limiter.limit == 4.25
+        await limiter.acquire()
+        limiter.release(failed=False, latency=1.0)
+        assert limiter.limit == 2.125
+
+    asyncio.run(scenario())
+
+
+def test_calls_started_before_a_decrease_do_not_decrease_again():
+    async def scenario():
+        limiter = make_limiter(initial=8, backoff=0.5)
+        for _ in range(3):
+            await limiter.acquire()
+        # Three calls in flight fail together: one congestion signal
+        for _ in range(3):
+            limiter.release(failed=True, latency=1.0)
+        assert limiter.limit == 4.0 and limiter.backoffs == 1
+        # A call started after the decrease counts again
+        await limiter.acquire()
+        limiter.release(failed=True, latency=0.0)
+        assert limiter.limit == 2.0 and limiter.backoffs == 2
+
+    asyncio.run(scenario())
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=10.0)
+    breaker.before_call()
+    breaker.record(failed=True)
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+    breaker.record(failed=True)
+    assert breaker.state == CircuitBreaker.OPEN and breaker.trips == 1
+    with pytest.raises(UpstreamUnavailable) as error:
+        breaker.before_call()
+    assert "circuit open" in error.value.detail
+
+
+def test_half_open_allows_a_single_trial():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=10.0)
+    breaker.record(failed=True)
+    breaker.opened_at = time.monotonic() - 11.0
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(UpstreamUnavailable) as error:
+        breaker.before_call()
+    assert "trial call in progress" in error.value.detail
+    breaker.record(failed=False)
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+
+
+def test_failed_half_open_trial_reopens():
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=10.0)
+    for _ in range(3):
+        breaker.record(failed=True)
+    breaker.opened_at = time.monotonic() - 11.0
+    breaker.before_call()
+    breaker.record(failed=True)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(UpstreamUnavailable):
+        breaker.before_call()
+
+
+def test_guard_releases_trial_when_not_admitted():
+    async def scenario():
+        guard = make_guard(make_limiter(initial=1, max_limit=1, max_queue=0), failure_threshold=1)
+        permit = await guard.acquire()
+        permit.release(failed=True)
+        assert guard.breaker.state == CircuitBreaker.OPEN
+        guard.breaker.opened_at = time.monotonic() - 11.0
+        # The trial holds the only slot, so a second trial is refused by the breaker
+        trial = await guard.acquire()
+        with pytest.raises(UpstreamUnavailable):
+            await guard.acquire()
+        trial.release(failed=False)
+        assert guard.breaker.state == CircuitBreaker.CLOSED
+
+        # A half-open trial rejected by a full limiter leaves room for the next trial
+        blocker = await guard.acquire()
+        guard.breaker.state = CircuitBreaker.OPEN
+        guard.breaker.opened_at = time.monotonic() - 11.0
+        with pytest.raises(UpstreamUnavailable) as error:
+            await guard.acquire()
+        assert "too many requests waiting" in error.value.detail
+        blocker.release(failed=False)
+        trial = await guard.acquire()
+        trial.release(failed=False)
+        assert guard.breaker.state == CircuitBreaker.CLOSED
+
+    asyncio.run(scenario())
+
+
+def test_permit_releases_once():
+    async def scenario():
+        guard = make_guard()
+        permit = await guard.acquire()
+        assert guard.limiter.in_flight == 1
+        permit.release(failed=False)
+        permit.release(failed=True)
+        assert guard.limiter.in_flight == 0
+        assert guard.breaker.failures == 0
+
+    asyncio.run(scenario())
+
+
+
+class SlowUpstream(httpx.AsyncBaseTransport):
+    """
+    Answers after `header_delay` seconds with a body whose chunks arrive `chunk_delay` apart.
+    """
+
+    def __init__(self, header_delay: float, chunk_delay: float, chunks=(b"once ", b"upon ", b"a time")):
+        self.header_delay = header_delay
+        self.chunk_delay = chunk_delay
+        self.chunks = chunks
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(self.header_delay)
+        return httpx.Response(200, stream=SlowBody(self.chunks, self.chunk_delay))
+
+
+class SlowBody(httpx.AsyncByteStream):
+    def __init__(self, chunks, delay: float):
+        self.chunks = chunks
+        self.delay = delay
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            await asyncio.sleep(self.delay)
+            yield chunk
+
+
+def test_long_stream_with_fast_headers_does_not_decrease_limit():
+    async def scenario():
+        # A healthy stream that outlasts the latency target
+        guard = make_guard(make_limiter(initial=4, latency_target=0.1, backoff=0.5))
+        transport = GuardedTransport(SlowUpstream(header_delay=0.0, chunk_delay=0.05), guard, "test")
+        async with httpx.AsyncClient(transport=transport, base_url="http://upstream") as client:
+            async with client.stream("GET", "/story") as response:
+                chunks = []
+                async for chunk in response.aiter_raw():
+                    # The slot is held while the body is streamed
+                    assert guard.limiter.in_flight == 1
+                    chunks.append(chunk)
+                assert b"".join(chunks) == b"once upon a time"
+        assert guard.limiter.in_flight == 0
+        assert guard.limiter.limit == 4.25 and guard.limiter.backoffs == 0
+
+    asyncio.run(scenario())
+
+
+def test_slow_headers_decrease_limit():
+    async def scenario():
+        guard = make_guard(make_limiter(initial=4, latency_target=0.1, backoff=0.5))
+        transport = GuardedTransport(SlowUpstream(header_delay=0.15, chunk_delay=0.0), guard, "test")
+        async with httpx.AsyncClient(transport=transport, base_url="http://upstream") as client:
+            await client.get("/story")
+        assert guard.limiter.limit == 2.0 and guard.limiter.backoffs == 1
+
+    asyncio.run(scenario())
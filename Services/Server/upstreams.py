@@ -0,0 +1,275 @@
+import os
+import logging
+from dataclasses import dataclass, fields
+from typing import Dict, Optional
+
+import httpx
+
+from common import metrics
+from limiter import AIMDLimiter, CircuitBreaker, Permit, UpstreamGuard, UpstreamUnavailable
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, default))
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, default))
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+@dataclass
+class UpstreamConfig:
+    """
+    Connection and admission settings for one upstream service.
+
+    Every field can be overridden with an environment variable named
+    `UPSTREAM_<NAME>_<FIELD>`, e.g. `UPSTREAM_AI_MAX_CONNECTIONS=20`
+    (`base_url` is read from `UPSTREAM_<NAME>_URL`).
+    """
+    name: str
+    base_url: str
+    timeout: float = 60.0
+    connect_timeout: float = 5.0
+    max_connections: int = 20
+    max_keepalive_connections: int = 10
+    keepalive_expiry: float = 30.0
+    http2: bool = False
+    # Adaptive concurrency limit (see limiter.AIMDLimiter)
+    concurrency_initial: int = 8
+    concurrency_min: int = 1
+    concurrency_max: int = 64
+    queue_size: int = 32
+    queue_timeout: float = 5.0
+    # Successful calls slower than this (seconds) also cut the limit; 0 disables
+    latency_target: float = 0.0
+    # Circuit breaker (see limiter.CircuitBreaker)
+    breaker_failures: int = 5
+    breaker_reset: float = 10.0
+
+    @classmethod
+    def from_env(cls, name: str, base_url: str, timeout: float, **overrides) -> "UpstreamConfig":
+        prefix = f"UPSTREAM_{name.upper()}_"
+        defaults = cls(name=name, base_url=base_url, timeout=timeout, **overrides)
+        values = {}
+        for field in fields(cls):
+            if field.name == "name":
+                continue
+            env_name = prefix + ("URL" if field.name == "base_url" else field.name.upper())
+            default = getattr(defaults, field.name)
+            if isinstance(default, bool):
+                values[field.name] = _env_bool(env_name, default)
+            elif isinstance(default, int):
+                values[field.name] = _env_int(env_name, default)
+            elif isinstance(default, float):
+                values[field.name] = _env_float(env_name, default)
+            else:
+                values[field.name] = os.getenv(env_name, default)
+        return cls(name=name, **values)
+
+
+class TimedTransport(httpx.AsyncBaseTransport):
+    """
+    Records the latency of every request to an upstream, up to the response headers
+    (for streamed responses that is the time to first byte).
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, target: str):
+        self._transport = transport
+        self._target = target
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        with metrics.upstream_timer(self._target):
+            response = await self._transport.handle_async_request(request)
+        metrics.record_upstream_server_timing(self._target, response.headers.get("server-timing", ""))
+        return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class GuardedStream(httpx.AsyncByteStream):
+    """
+    Response body that holds the upstream's concurrency slot until it is closed,
+    so a streamed response counts against the limit for as long as it is being relayed.
+    """
+
+    def __init__(self, stream: httpx.AsyncByteStream, permit: Permit, failed: bool):
+        self._stream = stream
+        self._permit = permit
+        self._failed = failed
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self._stream:
+                yield chunk
+        except httpx.TransportError:
+            self._failed = True
+            raise
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._permit.release(self._failed)
+
+
+class GuardedTransport(httpx.AsyncBaseTransport):
+    """
+    Admission control in front of an upstream: requests are rejected with
+    `UpstreamUnavailable` (503) when its circuit is open or its wait queue is full.
+    Timeouts, connection errors and 5xx responses count as failures.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, guard: UpstreamGuard, target: str):
+        self._transport = transport
+        self._guard = guard
+        self._target = target
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        try:
+            permit = await self._guard.acquire()
+        except UpstreamUnavailable as exc:
+            metrics.count(f"upstream_{self._target}_rejected")
+            logger.warning(exc.detail)
+            raise
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException as exc:
+            # A cancelled caller says nothing about the upstream's health
+            permit.release(failed=isinstance(exc, httpx.TransportError))
+            raise
+        # The latency target applies up to the headers; the slot is held until the body is closed
+        permit.answered()
+        response.stream = GuardedStream(response.stream, permit, failed=response.status_code >= 500)
+        return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class Upstream:
+    """
+    A long-lived, pooled `httpx.AsyncClient` for a single upstream service.
+    """
+
+    def __init__(self, config: UpstreamConfig):
+        self.config = config
+        self.requests_total = 0
+        self.http2 = config.http2 and _http2_available()
+        if config.http2 and not self.http2:
+            logger.warning(f"HTTP/2 requested for '{config.name}' but the 'h2' package is not installed")
+        self.transport = httpx.AsyncHTTPTransport(
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=config.max_connections,
+                max_keepalive_connections=config.max_keepalive_connections,
+                keepalive_expiry=config.keepalive_expiry,
+            ),
+        )
+        self.guard = UpstreamGuard(
+            AIMDLimiter(
+                config.name,
+                initial=config.concurrency_initial,
+                min_limit=config.concurrency_min,
+                max_limit=config.concurrency_max,
+                max_queue=config.queue_size,
+                queue_timeout=config.queue_timeout,
+                latency_target=config.latency_target,
+            ),
+            CircuitBreaker(config.name, config.breaker_failures, config.breaker_reset),
+        )
+        metrics.track_queue(f"upstream_{config.name}_waiting", lambda: self.guard.limiter.waiting)
+        metrics.track_queue(f"upstream_{config.name}_in_flight", lambda: self.guard.limiter.in_flight)
+        metrics.track_queue(f"upstream_{config.name}_limit", lambda: self.guard.limiter.limit)
+        self.client = httpx.AsyncClient(
+            base_url=config.base_url,
+            transport=GuardedTransport(TimedTransport(self.transport, config.name), self.guard, config.name),
+            timeout=httpx.Timeout(config.timeout, connect=config.connect_timeout),
+            event_hooks={"request": [self._count_request]},
+        )
+
+    async def _count_request(self, request: httpx.Request):
+        self.requests_total += 1
+
+    def stats(self) -> Dict[str, object]:
+        """
+        Snapshot of the connection pool. httpx does not expose its pool publicly,
+        so connection states are read from the underlying httpcore pool when available.
+        """
+        connections = []
+        pool = getattr(self.transport, "_pool", None)
+        if pool is not None:
+            connections = list(getattr(pool, "connections", []))
+        idle = sum(1 for conn in connections if conn.is_idle())
+        return {
+            "base_url": self.config.base_url,
+            "http2": self.http2,
+            "max_connections": self.config.max_connections,
+            "max_keepalive_connections": self.config.max_keepalive_connections,
+            "connections": len(connections),
+            "active_connections": len(connections) - idle,
+            "idle_connections": idle,
+            "requests_total": self.requests_total,
+            **self.guard.stats(),
+        }
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class Upstreams:
+    """
+    The gateway's upstream clients, created on application startup and closed on shutdown.
+    """
+
+    def __init__(self):
+        self.nlp: Optional[Upstream] = None
+        self.ai: Optional[Upstream] = None
+        self.tts: Optional[Upstream] = None
+
+    def start(self):
+        # Latency targets sit well above a normal call, so a slowing but still answering
+        # upstream gets backpressure long before its calls time out
+        self.nlp = Upstream(UpstreamConfig.from_env(
+            "nlp", "http://0.0.0.0:6060", timeout=10.0, concurrency_initial=16, concurrency_max=64,
+            latency_target=2.0,
+        ))
+        # LM Studio and TTS only run a handful of generations at once; keep their limits small
+        self.ai = Upstream(UpstreamConfig.from_env(
+            "ai", "http://0.0.0.0:7000", timeout=60.0, concurrency_initial=4, concurrency_max=16,
+            latency_target=30.0,
+        ))
+        self.tts = Upstream(UpstreamConfig.from_env(
+            "tts", "http://0.0.0.0:6080", timeout=120.0, concurrency_initial=2, concurrency_max=8,
+            latency_target=60.0,
+        ))
+        for upstream in self.all():
+            logger.info(f"Upstream '{upstream.config.name}' configured: {upstream.config}")
+
+    def all(self):
+        return [upstream for upstream in (self.nlp, self.ai, self.tts) if upstream is not None]
+
+    def stats(self) -> Dict[str, Dict[str, object]]:
+        return {upstream.config.name: upstream.stats() for upstream in self.all()}
+
+    async def aclose(self):
+        for upstream in self.all():
+            await upstream.aclose()
+        self.nlp = self.ai = self.tts = None
+
+
+upstreams = Upstreams()
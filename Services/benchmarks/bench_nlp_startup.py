@@ -0,0 +1,102 @@
+"""
+Benchmark NLP service startup: time until it is live (`/health`) and ready (`/ready`).
+
+Starts the service once per configuration and run, and polls both endpoints:
+
+- `sequential`: all models loaded on startup, one after another
+- `parallel`: the default, all models loaded on startup in parallel threads
+- `parallel+lazy`: the sentence model loaded on first use rather than on startup
+
+Models are read from the local cache (`NLP_MODELS_OFFLINE`), so fill it first with
+`python ../NLP/models.py`. The service needs PostgreSQL (`DATABASE_URL`) for its schema check:
+
+    python bench_nlp_startup.py --runs 3 --output nlp_startup.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from pathlib import Path
+from typing import Dict, Optional
+
+import httpx
+
+from loadgen import summarize
+
+NLP_DIR = Path(__file__).resolve().parent.parent / "NLP"
+
+CONFIGS: Dict[str, Dict[str, str]] = {
+    "sequential": {"NLP_MODEL_LOAD_WORKERS": "1", "NLP_LAZY_MODELS": ""},
+    "parallel": {"NLP_MODEL_LOAD_WORKERS": "3", "NLP_LAZY_MODELS": ""},
+    "parallel+lazy": {"NLP_MODEL_LOAD_WORKERS": "3", "NLP_LAZY_MODELS": "sentence"},
+}
+
+
+def wait_for(client: httpx.Client, path: str, deadline: float, process: subprocess.Popen) -> Optional[httpx.Response]:
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"NLP service exited with code {process.returncode}")
+        try:
+            response = client.get(path, timeout=1.0)
+            if response.status_code == 200:
+                return response
+        except httpx.TransportError:
+            pass
+        time.sleep(0.05)
+    return None
+
+
+def start_once(env: Dict[str, str], args) -> Dict[str, object]:
+    started = time.monotonic()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(args.port)],
+        cwd=NLP_DIR,
+        env={**os.environ, **env},
+        stdout=subprocess.DEVNULL if not args.verbose else None,
+        stderr=subprocess.DEVNULL if not args.verbose else None,
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{args.port}") as client:
+            deadline = started + args.timeout
+            if wait_for(client, "/health", deadline, process) is None:
+                raise RuntimeError("NLP service did not become live in time")
+            live_s = time.monotonic() - started
+            ready = wait_for(client, "/ready", deadline, process)
+            if ready is None:
+                raise RuntimeError("NLP service did not become ready in time")
+            ready_s = time.monotonic() - started
+            return {"live_s": live_s, "ready_s": ready_s, "status": ready.json()}
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--configs", default=",".join(CONFIGS), help="Comma-separated configurations to run")
+    parser.add_argument("--runs", type=int, default=3, help="Starts per configuration")
+    parser.add_argument("--port", type=int, default=6099)
+    parser.add_argument("--timeout", type=float, default=600.0, help="Seconds to wait for one start")
+    parser.add_argument("--verbose", action="store_true", help="Show the service output")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = {"benchmark": "nlp_startup", "runs": args.runs, "configs": {}}
+    for name in args.configs.split(","):
+        runs = [start_once(CONFIGS[name], args) for _ in range(args.runs)]
+        results["configs"][name] = {
+            # summarize() reports milliseconds
+            "time_to_live_ms": summarize([run["live_s"] * 1000 for run in runs]),
+            "time_to_ready_ms": summarize([run["ready_s"] * 1000 for run in runs]),
+            "ready_status_last_run": runs[-1]["status"],
+        }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Benchmark prompt prefill time (time to first token) for the AI service's prompt layouts.
+
+Sends story and chat prompts straight to an LM server, comparing:
+
+- `legacy`: the previous layout, one system message with the diary entry or history in the middle
+- `prefix`: the current layout from `Services/AI/prompts.py`, static instructions first
+- `prefix+affinity` (chat only): the current layout with each conversation pinned to an LM slot
+
+Against llama.cpp (or the fake LM with `--prefix-cache`), cached prompt prefixes skip prefill:
+
+    python fake_lm.py --port 1234 --ttft-ms 50 --prefill-ms-per-token 2 --prefix-cache --slots 4
+    python bench_prefill.py --lm-url http://localhost:1234 --slots 4 --output prefill.json
+"""
+import sys
+import json
+import time
+import hashlib
+import argparse
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+# Prompt builders of the AI service
+sys.path.append(str(Path(__file__).resolve().parent.parent / "AI"))
+from prompts import CHAT_SYSTEM_PROMPT, STORY_SYSTEM_PROMPT, create_chat_prompt, create_story_prompt  # noqa: E402
+
+from loadgen import DIARY_ENTRY, summarize  # noqa: E402
+
+
+def legacy_story_prompt(diary_entry: str) -> List[dict]:
+    # Layout before the prompt builders were split into a static prefix and variable content
+    intro, instructions = STORY_SYSTEM_PROMPT.split("**Storytelling Instructions:**\n")
+    content = (
+        f"{intro}**Annotated Diary Entry for Storytelling:**\n{diary_entry}\n\n"
+        f"**Storytelling Instructions:**\n{instructions}"
+    )
+    return [{"role": "system", "content": content}]
+
+
+def legacy_chat_prompt(user_message: str, prev_msgs: List[str]) -> List[dict]:
+    intro, instructions = CHAT_SYSTEM_PROMPT.split("**Instructions:**\n")
+    history = "\n".join(prev_msgs)
+    content = (
+        f"{intro}**Conversation History:**\n{history}\n\n"
+        f"**User Query:**\n{user_message}\n\n**Instructions:**\n{instructions}"
+    )
+    return [{"role": "system", "content": content}]
+
+
+def slot_for(session_id: str, slots: int) -> int:
+    # Same mapping as lm_slot_for() in Services/AI/main.py
+    return int(hashlib.sha256(session_id.encode("utf-8")).hexdigest()[:8], 16) % slots
+
+
+def time_to_first_token(client: httpx.Client, messages: List[dict], args, slot: Optional[int] = None) -> float:
+    payload = {
+        "model": args.model,
+        "messages": messages,
+        "temperature": 1.0,
+        "max_tokens": args.max_tokens,
+        "stream": True,
+    }
+    if slot is not None:
+        payload["id_slot"] = slot
+        payload["cache_prompt"] = True
+    started = time.perf_counter()
+    first_token = None
+    with client.stream("POST", "/v1/chat/completions", json=payload) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if first_token is None and line.startswith("data:") and '"content"' in line:
+                first_token = time.perf_counter()
+    return ((first_token or time.perf_counter()) - started) * 1000
+
+
+def bench_story(client: httpx.Client, build: Callable, args) -> Dict[str, object]:
+    ttfts = []
+    for index in range(args.entries):
+        entry = f"{DIARY_ENTRY}\n(Entry {index})"
+        ttfts.append(time_to_first_token(client, build(entry), args))
+    return {"ttft_ms": summarize(ttfts)}
+
+
+def bench_chat(client: httpx.Client, build: Callable, args, affinity: bool = False) -> Dict[str, object]:
+    """
+    Interleave several conversations turn by turn, as concurrent users would.
+    """
+    histories = {f"conversation-{c}": [] for c in range(args.conversations)}
+    ttfts = []
+    for turn in range(args.turns):
+        for conversation_id, history in histories.items():
+            message = f"What else do you remember about the lake? (turn {turn})"
+            slot = slot_for(conversation_id, args.slots) if affinity else None
+            ttfts.append(time_to_first_token(client, build(message, history), args, slot))
+            history += [f"User: {message}", f"Assistant: I remember the water was calm on turn {turn}."]
+    return {"ttft_ms": summarize(ttfts)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lm-url", default="http://localhost:1234")
+    parser.add_argument("--model", default="amethyst-13b-mistral")
+    parser.add_argument("--slots", type=int, default=4, help="Slots of the LM server, for affinity")
+    parser.add_argument("--entries", type=int, default=8, help="Distinct diary entries for the story runs")
+    parser.add_argument("--conversations", type=int, default=4)
+    parser.add_argument("--turns", type=int, default=6)
+    parser.add_argument("--max-tokens", type=int, default=4, help="Tokens generated per request")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    with httpx.Client(base_url=args.lm_url, timeout=300) as client:
+        results = {
+            "benchmark": "prefill",
+            "lm_url": args.lm_url,
+            "story": {
+                "legacy": bench_story(client, legacy_story_prompt, args),
+                "prefix": bench_story(client, create_story_prompt, args),
+            },
+            "chat": {
+                "legacy": bench_chat(client, legacy_chat_prompt, args),
+                "prefix": bench_chat(client, create_chat_prompt, args),
+                "prefix+affinity": bench_chat(client, create_chat_prompt, args, affinity=True),
+            },
+        }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Microbenchmark relationship resolution for one annotation.
+
+Compares the old NLP flow, which built a NetworkX graph of the profile for every
+annotation and ran `nx.shortest_path` for each person found, with the compiled
+`RelationshipIndex` of `Services/NLP/annotation.py`, both when the profile's index has
+to be compiled (first annotation of a profile) and when it is cached.
+
+Also checks that the index resolves every name in the profile like the graph did:
+
+    python bench_relationships.py --iterations 5000 --output relationships.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import contextlib
+from pathlib import Path
+from typing import Callable, List
+
+import networkx as nx
+
+from loadgen import summarize
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "NLP"))
+import annotation  # noqa: E402
+from annotation import RelationshipIndex, canonical_kinship, get_relationship_index  # noqa: E402
+
+KINSHIP_TERMS = ["Amma", "Appa", "Beti", "Dad", "Mom", "Didi"]
+
+
+# Old flow, as it was in Services/NLP/main.py (without its debug output)
+def build_relationship_graph(personal_data):
+    G = nx.DiGraph()
+    main_user = personal_data["full_name"].lower()
+    G.add_node(main_user, info=personal_data)
+    family = personal_data.get("social_interactions", {}).get("family", {})
+    for child_key, child_info in family.items():
+        name = child_info["name"].lower()
+        G.add_node(name, info=child_info)
+        G.add_edge(main_user, name, relation=child_key)
+        G.add_edge(name, main_user, relation=f"{child_key} of {main_user}")
+        for grandchild in child_info.get("children", []):
+            gc_name = grandchild["name"].lower()
+            gc_relation = f"grandchild ({child_key})"
+            G.add_node(gc_name, info=grandchild)
+            G.add_edge(name, gc_name, relation=gc_relation)
+            G.add_edge(gc_name, name, relation=f"{gc_relation} of {name}")
+    friends = personal_data.get("social_interactions", {}).get("friends", {}).get("close_friends", [])
+    for friend in friends:
+        name = friend["name"].lower()
+        G.add_node(name, info=friend)
+        G.add_edge(main_user, name, relation="friend")
+        G.add_edge(name, main_user, relation=f"friend of {main_user}")
+    return G
+
+
+def find_relationship(G, main_user, target_name):
+    target_name = target_name.lower()
+    main_user = main_user.lower()
+    if target_name not in G.nodes:
+        return "Unknown"
+    try:
+        path = nx.shortest_path(G, source=main_user, target=target_name)
+        return G.get_edge_data(main_user, path[1])["relation"] if len(path) >= 2 else "Unknown"
+    except nx.NetworkXNoPath:
+        return "Unknown"
+
+
+def sample_profile(profile_id: int, family_size: int, grandchildren: int, friends: int) -> dict:
+    relations = ["son", "daughter", "wife", "brother", "sister", "uncle", "aunt", "cousin"]
+    family = {}
+    for index in range(family_size):
+        relation = relations[index] if index < len(relations) else f"relative_{index}"
+        family[relation] = {
+            "name": f"Member{profile_id}x{index}",
+            "nickname": f"Nick{profile_id}x{index}",
+            "children": [{"name": f"Grandchild{profile_id}x{index}x{child}"} for child in range(grandchildren)],
+        }
+    return {
+        "id": profile_id,
+        "full_name": f"Profile Owner {profile_id}",
+        "nickname": "Owner",
+        "social_interactions": {
+            "family": family,
+            "friends": {"close_friends": [{"name": f"Friend{profile_id}x{index}"} for index in range(friends)]},
+        },
+    }
+
+
+def profile_names(profile: dict) -> List[str]:
+    social = profile["social_interactions"]
+    names = [profile["full_name"]]
+    for member in social["family"].values():
+        names.append(member["name"])
+        names.extend(child["name"] for child in member.get("children", []))
+    names.extend(friend["name"] for friend in social["friends"]["close_friends"])
+    return names
+
+
+def graph_flow(profile: dict, persons: List[str]) -> List[str]:
+    G = build_relationship_graph(profile)
+    return [find_relationship(G, profile["full_name"], canonical_kinship(name)) for name in persons]
+
+
+def index_flow(profile: dict, persons: List[str]) -> List[str]:
+    index = get_relationship_index(profile)
+    return [index.relationship_of(name) for name in persons]
+
+
+def measure(fn: Callable[[dict, List[str]], List[str]], profile: dict, persons: List[str], iterations: int,
+            cold: bool = False) -> dict:
+    latencies_us = []
+    for _ in range(iterations):
+        if cold:
+            annotation._relationship_indexes.clear()
+        started = time.perf_counter()
+        fn(profile, persons)
+        latencies_us.append((time.perf_counter() - started) * 1_000_000)
+    # summarize() rounds to two decimals; values here are microseconds
+    return summarize(latencies_us)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000, help="Annotations per flow")
+    parser.add_argument("--family", type=int, default=6, help="Family members in the profile")
+    parser.add_argument("--grandchildren", type=int, default=2, help="Children of each family member")
+    parser.add_argument("--friends", type=int, default=10, help="Close friends in the profile")
+    parser.add_argument("--persons", type=int, default=8, help="Persons found per annotation")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    profile = sample_profile(1, args.family, args.grandchildren, args.friends)
+    names = profile_names(profile)
+    candidates = names + KINSHIP_TERMS + ["Stranger", "Someone Else"]
+    persons = [random.choice(candidates) for _ in range(args.persons)]
+
+    # The index logs when it compiles a profile
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        index = RelationshipIndex(profile)
+        graph = build_relationship_graph(profile)
+        mismatches = [
+            name for name in names
+            if index.relationship_of(name) != find_relationship(graph, profile["full_name"], name)
+        ]
+        results = {
+            "benchmark": "relationships",
+            "iterations": args.iterations,
+            "profile": {
+                "family": args.family,
+                "grandchildren": args.grandchildren,
+                "friends": args.friends,
+                "names": len(names),
+            },
+            "persons_per_annotation": args.persons,
+            "mismatched_names": mismatches,
+            "latency_us": {
+                "graph": measure(graph_flow, profile, persons, args.iterations),
+                "index_compiled": measure(index_flow, profile, persons, args.iterations, cold=True),
+                "index_cached": measure(index_flow, profile, persons, args.iterations),
+            },
+        }
+    latency = results["latency_us"]
+    results["speedup_cached_vs_graph"] = round(latency["graph"]["mean"] / latency["index_cached"]["mean"], 1)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Compare two benchmark reports written by loadgen.py.
+
+    python compare.py baseline.json candidate.json
+
+Prints, per scenario, the baseline and candidate values of throughput, error rate and
+latency percentiles with the relative change. `--json` prints the comparison as JSON.
+"""
+import sys
+import json
+import argparse
+
+METRICS = [
+    ("throughput_rps", None),
+    ("error_rate", None),
+    ("latency_ms", "p50"),
+    ("latency_ms", "p95"),
+    ("latency_ms", "p99"),
+    ("ttfb_ms", "p50"),
+    ("ttfb_ms", "p95"),
+]
+
+
+def metric_value(result: dict, key: str, sub: str):
+    value = result.get(key)
+    return value.get(sub) if sub and isinstance(value, dict) else value
+
+
+def compare(baseline: dict, candidate: dict) -> dict:
+    comparison = {}
+    scenarios = [name for name in baseline["results"] if name in candidate["results"]]
+    for scenario in scenarios:
+        rows = {}
+        for key, sub in METRICS:
+            name = f"{key}.{sub}" if sub else key
+            before = metric_value(baseline["results"][scenario], key, sub)
+            after = metric_value(candidate["results"][scenario], key, sub)
+            change = None
+            if before not in (None, 0) and after is not None:
+                change = round((after - before) / before * 100, 1)
+            rows[name] = {"baseline": before, "candidate": after, "change_pct": change}
+        comparison[scenario] = rows
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--json", action="store_true", help="Print the comparison as JSON")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    comparison = compare(baseline, candidate)
+    if args.json:
+        json.dump(comparison, sys.stdout, indent=2)
+        print()
+        return
+
+    print(f"{baseline.get('label')} -> {candidate.get('label')}")
+    for scenario, rows in comparison.items():
+        print(f"\n[{scenario}]")
+        for name, row in rows.items():
+            change = f"{row['change_pct']:+.1f}%" if row["change_pct"] is not None else "n/a"
+            print(f"  {name:<18} {str(row['baseline']):>12} -> {str(row['candidate']):>12}  {change}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Stand-in for LM Studio: an OpenAI-compatible `/v1/chat/completions` server with
+configurable prefill latency, decode speed and batch capacity.
+
+    python fake_lm.py --port 1234 --ttft-ms 400 --tokens-per-sec 40 --max-tokens 300 --slots 4
+
+Requests beyond `--slots` wait for a free slot, like a saturated LM server. Prompts asking
+for JSON (the NLP service's annotation refinement) get a valid JSON object back.
+
+With `--prefill-ms-per-token`, prefill time grows with the prompt length. Add `--prefix-cache`
+to simulate llama.cpp's per-slot prompt cache: only the part of the prompt that differs from
+the slot's previous prompt is prefilled. Requests go to the slot given in `id_slot`, or else
+to the least recently used free slot.
+"""
+import math
+import time
+import json
+import asyncio
+import argparse
+from typing import AsyncIterator, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Fake LM server")
+
+# Overridden from the command line in main()
+config = argparse.Namespace(
+    ttft_ms=400.0, tokens_per_sec=40.0, max_tokens=300, slots=4, model="fake-lm",
+    prefill_ms_per_token=0.0, prefix_cache=False,
+)
+CHARS_PER_TOKEN = 4
+
+
+class SlotPool:
+    """
+    Generation slots, each remembering the last prompt it processed.
+    """
+
+    def __init__(self, count: int):
+        self.free = [True] * count
+        self.cached = [""] * count
+        self.last_used = [0.0] * count
+        self._changed = asyncio.Condition()
+
+    async def acquire(self, wanted: Optional[int]) -> int:
+        async with self._changed:
+            while True:
+                if wanted is not None and 0 <= wanted < len(self.free):
+                    candidates = [wanted] if self.free[wanted] else []
+                else:
+                    candidates = [i for i, free in enumerate(self.free) if free]
+                if candidates:
+                    slot = min(candidates, key=lambda i: self.last_used[i])
+                    self.free[slot] = False
+                    return slot
+                await self._changed.wait()
+
+    async def release(self, slot: int):
+        async with self._changed:
+            self.free[slot] = True
+            self.last_used[slot] = time.perf_counter()
+            self._changed.notify_all()
+
+
+slots = SlotPool(config.slots)
+
+WORDS = (
+    "The morning light spilled across the kitchen table as she remembered the old house. "
+    "The family gathered by the river every summer and laughter filled the air. "
+    "Her brother skipped stones while Amma packed lunch under the mango tree."
+).split()
+
+
+def prompt_text(body: dict) -> str:
+    return "\n".join(str(message.get("content", "")) for message in body.get("messages", []))
+
+
+def rendered_prompt(body: dict) -> str:
+    # Roughly what a chat template produces; role boundaries matter for prefix matching
+    return "".join(f"<|{message.get('role')}|>{message.get('content', '')}\n" for message in body.get("messages", []))
+
+
+def common_prefix(a: str, b: str) -> int:
+    length = min(len(a), len(b))
+    for i in range(length):
+        if a[i] != b[i]:
+            return i
+    return length
+
+
+def completion_tokens(body: dict) -> list:
+    """
+    Produce the tokens of the completion. JSON-seeking prompts get a JSON object, split into tokens.
+    """
+    max_tokens = body.get("max_tokens") or config.max_tokens
+    count = config.max_tokens if max_tokens < 0 else min(config.max_tokens, max_tokens)
+    if "JSON" in prompt_text(body):
+        content = json.dumps({"refined_text": " ".join(WORDS), "annotations": []})
+        return [content[i:i + 4] for i in range(0, len(content), 4)]
+    return [(" " if i else "") + WORDS[i % len(WORDS)] for i in range(count)]
+
+
+async def generate(tokens: list, body: dict, timings: dict) -> AsyncIterator[str]:
+    """
+    Yield tokens at the configured speed after the prefill delay, holding one batch slot.
+    `timings` is filled in with llama.cpp-style prompt processing stats.
+    """
+    slot = await slots.acquire(body.get("id_slot"))
+    try:
+        prompt = rendered_prompt(body)
+        cached_chars = common_prefix(prompt, slots.cached[slot]) if config.prefix_cache else 0
+        prompt_n = math.ceil((len(prompt) - cached_chars) / CHARS_PER_TOKEN)
+        prefill_ms = config.ttft_ms + prompt_n * config.prefill_ms_per_token
+        timings.update(id_slot=slot, cache_n=cached_chars // CHARS_PER_TOKEN, prompt_n=prompt_n,
+                       prompt_ms=round(prefill_ms, 1))
+        await asyncio.sleep(prefill_ms / 1000)
+
+        interval = 1 / config.tokens_per_sec if config.tokens_per_sec > 0 else 0
+        next_at = time.perf_counter()
+        for token in tokens:
+            yield token
+            next_at += interval
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+        slots.cached[slot] = prompt + "".join(tokens)
+    finally:
+        await slots.release(slot)
+
+
+@app.get("/v1/models")
+async def models():
+    return {"object": "list", "data": [{"id": config.model, "object": "model"}]}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    tokens = completion_tokens(body)
+    created = int(time.time())
+    model = body.get("model", config.model)
+    prompt_tokens = len(prompt_text(body).split())
+    timings = {}
+
+    if body.get("stream"):
+        async def events():
+            async for token in generate(tokens, body, timings):
+                chunk = {"object": "chat.completion.chunk", "created": created, "model": model,
+                         "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+            done = {"object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens)},
+                    "timings": timings}
+            yield f"data: {json.dumps(done)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    content = "".join([token async for token in generate(tokens, body, timings)])
+    return JSONResponse({
+        "object": "chat.completion",
+        "created": created,
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(tokens),
+            "total_tokens": prompt_tokens + len(tokens),
+        },
+        "timings": timings,
+    })
+
+
+def main():
+    global slots
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1234)
+    parser.add_argument("--ttft-ms", type=float, default=config.ttft_ms, help="Prefill delay before the first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=config.tokens_per_sec, help="Decode speed per request")
+    parser.add_argument("--max-tokens", type=int, default=config.max_tokens, help="Completion length")
+    parser.add_argument("--slots", type=int, default=config.slots, help="Requests generated concurrently")
+    parser.add_argument("--model", default=config.model)
+    parser.add_argument("--prefill-ms-per-token", type=float, default=config.prefill_ms_per_token,
+                        help="Extra prefill time per uncached prompt token")
+    parser.add_argument("--prefix-cache", action="store_true", help="Reuse each slot's previous prompt prefix")
+    args = parser.parse_args()
+    vars(config).update(vars(args))
+    slots = SlotPool(args.slots)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Stand-in for the TTS service's `/synthesize` endpoint.
+
+Accepts the same multipart fields as the real service and streams back a silent WAV whose
+duration matches the text, after a configurable first-chunk delay and at a configurable
+real-time factor.
+
+    python fake_tts.py --port 6080 --first-chunk-ms 300 --realtime-factor 0.3
+"""
+import struct
+import asyncio
+import argparse
+
+import uvicorn
+from fastapi import FastAPI, File, Form, UploadFile
+from fastapi.responses import StreamingResponse
+
+app = FastAPI(title="Fake TTS server")
+
+SAMPLE_RATE = 24000
+CHUNK_SECONDS = 0.5
+CHARS_PER_SECOND = 15  # Roughly the pace of speech
+
+# Overridden from the command line in main()
+config = argparse.Namespace(first_chunk_ms=300.0, realtime_factor=0.3)
+
+
+def wav_header(num_samples: int) -> bytes:
+    data_size = num_samples * 2
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_size, b"WAVE", b"fmt ", 16, 1, 1,
+        SAMPLE_RATE, SAMPLE_RATE * 2, 2, 16, b"data", data_size,
+    )
+
+
+@app.post("/synthesize")
+async def synthesize(
+    text: str = Form(...),
+    ref_audio: UploadFile = File(...),
+    style: str = Form("default"),
+    language: str = Form("English"),
+    speed: str = Form("1"),
+):
+    # Drain the reference upload like the real service does
+    while await ref_audio.read(64 * 1024):
+        pass
+
+    audio_seconds = max(1.0, len(text) / CHARS_PER_SECOND)
+    total_samples = int(audio_seconds * SAMPLE_RATE)
+    chunk_samples = int(CHUNK_SECONDS * SAMPLE_RATE)
+
+    async def audio():
+        await asyncio.sleep(config.first_chunk_ms / 1000)
+        yield wav_header(total_samples)
+        remaining = total_samples
+        while remaining > 0:
+            samples = min(chunk_samples, remaining)
+            await asyncio.sleep(samples / SAMPLE_RATE * config.realtime_factor)
+            yield b"\x00\x00" * samples
+            remaining -= samples
+
+    return StreamingResponse(audio(), media_type="audio/wav")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6080)
+    parser.add_argument("--first-chunk-ms", type=float, default=config.first_chunk_ms)
+    parser.add_argument("--realtime-factor", type=float, default=config.realtime_factor,
+                        help="Synthesis time per second of audio")
+    args = parser.parse_args()
+    vars(config).update(vars(args))
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
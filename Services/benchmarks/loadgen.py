@@ -0,0 +1,251 @@
+"""
+Load and latency benchmark for the Livie services.
+
+Drives the gateway (`/story`, `/chat`, `/voice`, `/story/voice`), the NLP service (`/annotate/`) and the
+Profile service (`/profiles/`) at a fixed concurrency. Reports throughput, error rate and
+p50/p95/p99 latency (full response and time to first byte) as JSON.
+
+    python loadgen.py --scenarios chat,story --concurrency 8 --requests 100 --label v2 --output v2.json
+
+See README.md for running the stack against the fake LM and TTS servers.
+"""
+import io
+import json
+import math
+import time
+import wave
+import asyncio
+import argparse
+import platform
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+SCENARIOS = ("story", "chat", "voice", "story_voice", "annotate", "profiles")
+
+DIARY_ENTRY = (
+    "Today Dad took me to the lake near Kottayam. Amma packed lunch and my brother Rahul "
+    "kept throwing stones into the water. We laughed until the sun went down.\nAnanya"
+)
+
+
+def reference_audio(seconds: float = 2.0) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(24000)
+        wav.writeframes(b"\x00\x00" * int(24000 * seconds))
+    return buffer.getvalue()
+
+
+def sample_persona(index: int) -> dict:
+    return {
+        "full_name": f"Benchmark User {index}",
+        "nickname": "Bench",
+        "gender": "Female",
+        "age": 78,
+        "date_of_birth": "1946-03-25",
+        "place_of_birth": "Kochi",
+        "nationality": "Indian",
+        "languages_spoken": ["English", "Malayalam"],
+        "religion": "None",
+        "caste": "None",
+        "marital_status": "Widowed",
+        "current_residence": {"city": "Kochi"},
+        "previous_residence": {"city": "Chennai"},
+        "personal_details": {},
+        "appearance": {},
+        "interests_and_hobbies": {"hobbies": ["gardening"]},
+        "social_interactions": {
+            "family": {"son": {"name": "Rahul", "children": []}, "daughter": {"name": "Ananya", "children": []}},
+            "friends": {"close_friends": [{"name": "Meera"}]},
+        },
+        "work_and_education": {},
+        "important_life_events": [{"event": "Retirement", "year": 2006}],
+    }
+
+
+def build_request(scenario: str, index: int, args, ref_audio: bytes) -> Callable[[httpx.AsyncClient], object]:
+    """
+    Return a function that opens the streamed request for one iteration of a scenario.
+    """
+    if scenario == "story":
+        params = {"profile_id": args.personal_id} if args.story_profile else None
+        return lambda client: client.stream("GET", f"{args.gateway_url}/story", params=params)
+    if scenario == "chat":
+        # Unique messages by default so the AI service cannot coalesce them
+        message = args.chat_message if args.identical else f"{args.chat_message} ({index})"
+        data = {"latest_msg": message, "prev_msgs": json.dumps(["Hello", "How are you today?"])}
+        return lambda client: client.stream("POST", f"{args.gateway_url}/chat", data=data)
+    if scenario == "voice":
+        data = {"voice_type": "default", "text": args.voice_text, "style": "default",
+                "language": "English", "speed": "1"}
+        files = {"ref_audio": ("reference.wav", ref_audio, "audio/wav")}
+        return lambda client: client.stream("POST", f"{args.gateway_url}{args.voice_path}", data=data, files=files)
+    if scenario == "story_voice":
+        # Time to first byte is the time to the first synthesized sentence
+        data = {"profile_id": str(args.personal_id)} if args.story_profile else {}
+        files = {"ref_audio": ("reference.wav", ref_audio, "audio/wav")}
+        return lambda client: client.stream("POST", f"{args.gateway_url}/story/voice", data=data, files=files)
+    if scenario == "annotate":
+        body = {"diary_entry": DIARY_ENTRY, "personal_id": args.personal_id}
+        return lambda client: follow_annotation_job(client, args.nlp_url, body)
+    if scenario == "profiles":
+        body = sample_persona(index)
+        return lambda client: client.stream("POST", f"{args.profile_url}/profiles/", json=body)
+    raise ValueError(f"Unknown scenario: {scenario}")
+
+
+@asynccontextmanager
+async def follow_annotation_job(client: httpx.AsyncClient, nlp_url: str, body: dict):
+    """
+    Queue an annotation job and open its event stream, which ends once the job is done,
+    so the latency covers the whole pipeline rather than just queueing the job.
+    """
+    job = await client.post(f"{nlp_url}/annotate/", json=body)
+    if job.is_error:
+        yield job
+        return
+    async with client.stream("GET", f"{nlp_url}{job.json()['events_url']}") as events:
+        yield events
+
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    # Nearest-rank percentile
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return round(sorted_values[rank], 2)
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    values = sorted(values)
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "mean": round(sum(values) / len(values), 2) if values else None,
+        "max": round(values[-1], 2) if values else None,
+    }
+
+
+async def run_scenario(scenario: str, args) -> dict:
+    ref_audio = reference_audio()
+    latencies: List[float] = []
+    ttfbs: List[float] = []
+    status_codes: Dict[str, int] = {}
+    errors = 0
+    next_index = 0
+    deadline = time.perf_counter() + args.duration if args.duration else None
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+
+        async def worker():
+            nonlocal next_index, errors
+            while True:
+                if deadline is not None:
+                    if time.perf_counter() >= deadline:
+                        return
+                elif next_index >= args.requests:
+                    return
+                index = next_index
+                next_index += 1
+
+                open_request = build_request(scenario, index, args, ref_audio)
+                started = time.perf_counter()
+                try:
+                    async with open_request(client) as response:
+                        first_byte = None
+                        async for _ in response.aiter_raw():
+                            if first_byte is None:
+                                first_byte = time.perf_counter()
+                        finished = time.perf_counter()
+                    status_codes[str(response.status_code)] = status_codes.get(str(response.status_code), 0) + 1
+                    if response.is_error:
+                        errors += 1
+                        continue
+                    latencies.append((finished - started) * 1000)
+                    ttfbs.append(((first_byte or finished) - started) * 1000)
+                except httpx.HTTPError as exc:
+                    errors += 1
+                    status_codes[type(exc).__name__] = status_codes.get(type(exc).__name__, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    total = len(latencies) + errors
+    return {
+        "requests": total,
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+        "latency_ms": summarize(latencies),
+        "ttfb_ms": summarize(ttfbs),
+        "status_codes": status_codes,
+    }
+
+
+async def run(args) -> dict:
+    results = {}
+    for scenario in args.scenarios:
+        print(f"Running '{scenario}' with concurrency {args.concurrency}...", flush=True)
+        results[scenario] = await run_scenario(scenario, args)
+        print(json.dumps(results[scenario]), flush=True)
+    return {
+        "label": args.label,
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "host": platform.node(),
+        "config": {
+            "concurrency": args.concurrency,
+            "requests": None if args.duration else args.requests,
+            "duration_s": args.duration,
+            "gateway_url": args.gateway_url,
+            "nlp_url": args.nlp_url,
+            "profile_url": args.profile_url,
+            "voice_path": args.voice_path,
+        },
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default="chat,story",
+                        help=f"Comma-separated list of: {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=50, help="Requests per scenario")
+    parser.add_argument("--duration", type=float, help="Run each scenario for this many seconds instead")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--gateway-url", default="http://localhost:8000")
+    parser.add_argument("--nlp-url", default="http://localhost:6060")
+    parser.add_argument("--profile-url", default="http://localhost:6040")
+    parser.add_argument("--personal-id", type=int, default=1, help="Profile id used by annotate and story")
+    parser.add_argument("--story-profile", action="store_true", help="Request stories for --personal-id only")
+    parser.add_argument("--chat-message", default="Tell me about the summer at the lake")
+    parser.add_argument("--identical", action="store_true", help="Send identical chat payloads")
+    parser.add_argument("--voice-text", default="The morning light spilled across the kitchen table.")
+    parser.add_argument("--voice-path", default="/voice/stream", help="/voice/stream or the JSON /voice")
+    parser.add_argument("--label", default="local", help="Name of this run, e.g. a git revision")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
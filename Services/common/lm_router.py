@@ -0,0 +1,341 @@
+"""
+Client-side routing of LM requests over one or more OpenAI-compatible LM servers
+(LM Studio, llama.cpp), shared by the AI and NLP services.
+
+Usage:
+
+    from common.lm_router import LMRouter
+
+    router = LMRouter.from_env("http://localhost:1234", timeout=120.0)
+    await router.start()                               # health checks in the background
+    res = await router.post("/v1/chat/completions", json=payload, session_id="conv-1")
+    async with router.stream("POST", "/v1/chat/completions", json=payload) as res:
+        ...
+    router.stats()                                     # per-backend requests, errors, latency
+    await router.close()
+
+Backends are listed in `LM_ENDPOINTS` (comma-separated base URLs). Each request goes to the
+healthy backend with the fewest outstanding requests, or, with a `session_id`, always to the
+same healthy backend (rendezvous hashing), so per-server state such as an `id_slot` prompt
+cache stays valid. With `pin_slot=True` the session is also pinned to one of the chosen
+backend's slots, counted per backend (`LM_SLOTS`, or `total_slots` from llama.cpp's `/props`).
+A request that cannot connect is retried on the next backend; anything that may have reached
+the server is not retried.
+"""
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from common import metrics
+
+logger = logging.getLogger(__name__)
+
+# Failures where the request never reached the server, so sending it elsewhere is safe
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+# Weight of the newest sample in the moving average of latency
+LATENCY_EWMA_ALPHA = 0.2
+
+
+class LMBackend:
+    """
+    One LM server: its pooled client, health and request statistics.
+    """
+
+    def __init__(self, url: str, timeout: float, max_connections: int, slots: Optional[int] = None):
+        self.url = url.rstrip("/")
+        # Parallel slots of this server; None until configured or read from /props
+        self.slots = slots
+        self.client = httpx.AsyncClient(
+            base_url=self.url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+        # Optimistic until the first health check says otherwise
+        self.healthy = True
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.connect_failures = 0
+        self.latency_total = 0.0
+        self.latency_ewma: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.last_check: Optional[float] = None
+
+    def begin(self):
+        self.outstanding += 1
+        self.requests += 1
+
+    def end(self, seconds: float, failed: bool, error: Optional[str] = None):
+        self.outstanding -= 1
+        self.latency_total += seconds
+        if self.latency_ewma is None:
+            self.latency_ewma = seconds
+        else:
+            self.latency_ewma += LATENCY_EWMA_ALPHA * (seconds - self.latency_ewma)
+        if failed:
+            self.errors += 1
+            if error:
+                self.last_error = error
+
+    def slot_for(self, session_id: str) -> int:
+        """
+        The slot of this server a session is pinned to (llama.cpp `id_slot`).
+        """
+        return int(hashlib.sha256(session_id.encode("utf-8")).hexdigest()[:8], 16) % (self.slots or 1)
+
+    def mark_down(self, error: str):
+        if self.healthy:
+            logger.warning(f"LM backend {self.url} marked unhealthy: {error}")
+        self.healthy = False
+        self.last_error = error
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "slots": self.slots,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "connect_failures": self.connect_failures,
+            "avg_latency_ms": round(self.latency_total / self.requests * 1000, 1) if self.requests else None,
+            "ewma_latency_ms": round(self.latency_ewma * 1000, 1) if self.latency_ewma is not None else None,
+            "last_error": self.last_error,
+            "last_check_age_s": round(time.monotonic() - self.last_check, 1) if self.last_check else None,
+        }
+
+
+class LMRouter:
+    """
+    Routes LM requests over several backends with health checks, least-outstanding-requests
+    balancing, session affinity and failover on connection errors.
+
+    Args:
+    - urls (List[str]): Base URLs of the LM servers, e.g. `http://gpu-1:1234`.
+    - timeout (float): Request timeout in seconds (per read when streaming).
+    - max_connections (int): Pooled connections per backend.
+    - health_path (str): Path probed with GET by the health checks.
+    - health_interval (float): Seconds between health checks; 0 disables them.
+    - health_timeout (float): Timeout of one health check.
+    - slots (int, optional): Parallel slots of each server; read from `/props` when not set.
+    """
+
+    def __init__(
+        self,
+        urls: List[str],
+        timeout: float,
+        max_connections: int = 8,
+        health_path: str = "/v1/models",
+        health_interval: float = 10.0,
+        health_timeout: float = 2.0,
+        slots: Optional[int] = None,
+    ):
+        if not urls:
+            raise ValueError("LMRouter needs at least one backend URL")
+        self.backends = [LMBackend(url, timeout, max_connections, slots) for url in urls]
+        self.health_path = health_path
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.failovers = 0
+        self._health_task: Optional[asyncio.Task] = None
+        metrics.track_queue("lm_backends_healthy", lambda: sum(b.healthy for b in self.backends))
+        metrics.track_queue("lm_outstanding", lambda: sum(b.outstanding for b in self.backends))
+
+    @classmethod
+    def from_env(cls, default_url: str, timeout: float, **kwargs) -> "LMRouter":
+        """
+        Build a router from `LM_ENDPOINTS` (comma-separated URLs), falling back to `default_url`.
+        `LM_HEALTH_INTERVAL` and `LM_HEALTH_TIMEOUT` override the health check settings, and
+        `LM_SLOTS` the parallel slots of each server.
+        """
+        urls = [url.strip() for url in os.getenv("LM_ENDPOINTS", "").split(",") if url.strip()]
+        kwargs.setdefault("health_interval", float(os.getenv("LM_HEALTH_INTERVAL", 10.0)))
+        kwargs.setdefault("health_timeout", float(os.getenv("LM_HEALTH_TIMEOUT", 2.0)))
+        if os.getenv("LM_SLOTS"):
+            kwargs.setdefault("slots", int(os.getenv("LM_SLOTS")))
+        return cls(urls or [default_url], timeout, **kwargs)
+
+    # ----------------------------------------
+    # Backend selection
+    # ----------------------------------------
+
+    def _affinity_score(self, session_id: str, backend: LMBackend) -> int:
+        digest = hashlib.sha256(f"{session_id}|{backend.url}".encode("utf-8")).hexdigest()
+        return int(digest[:16], 16)
+
+    def pick(self, session_id: Optional[str] = None, exclude: Optional[List[LMBackend]] = None) -> Optional[LMBackend]:
+        """
+        Choose a backend for the next request, skipping `exclude`.
+
+        Healthy backends are preferred; if none is healthy, all are tried, since a failed
+        health check may be stale. With a `session_id` the choice is sticky: the backend
+        with the highest rendezvous hash wins, so sessions only move when it goes down.
+        Otherwise the backend with the fewest outstanding requests (then lowest latency) wins.
+        """
+        candidates = [b for b in self.backends if not exclude or b not in exclude]
+        if not candidates:
+            return None
+        candidates = [b for b in candidates if b.healthy] or candidates
+        if session_id:
+            return max(candidates, key=lambda b: self._affinity_score(session_id, b))
+        return min(candidates, key=lambda b: (b.outstanding, b.latency_ewma or 0.0))
+
+    # ----------------------------------------
+    # Requests
+    # ----------------------------------------
+
+    @asynccontextmanager
+    async def stream(
+        self, method: str, path: str, session_id: Optional[str] = None, pin_slot: bool = False, **kwargs
+    ) -> AsyncIterator[httpx.Response]:
+        """
+        Send a request and yield the response with its body not yet read.
+        The backend counts the request as outstanding until the block exits.
+
+        Args:
+        - method (str): HTTP method.
+        - path (str): Path on the LM server, e.g. `/v1/chat/completions`.
+        - session_id (str, optional): Keeps all requests of a session on one backend.
+        - pin_slot (bool): Also pin the session to one slot of that backend, by adding
+          `id_slot` and `cache_prompt` to the `json` body.
+        - **kwargs: Passed to `httpx.AsyncClient.build_request` (`json`, `headers`, ...).
+
+        Yields:
+        - httpx.Response: The streaming response.
+        """
+        tried: List[LMBackend] = []
+        while True:
+            backend = self.pick(session_id, exclude=tried)
+            if backend is None:
+                raise httpx.ConnectError(f"No LM backend reachable ({len(tried)} tried)")
+            tried.append(backend)
+            backend.begin()
+            started = time.perf_counter()
+            try:
+                request_kwargs = kwargs
+                if pin_slot and session_id and kwargs.get("json") is not None:
+                    # The slot index is per server, so it is chosen once the server is
+                    request_kwargs = {
+                        **kwargs,
+                        "json": {**kwargs["json"], "id_slot": backend.slot_for(session_id), "cache_prompt": True},
+                    }
+                request = backend.client.build_request(method, path, **request_kwargs)
+                response = await backend.client.send(request, stream=True)
+                break
+            except RETRYABLE_ERRORS as exc:
+                error = f"{type(exc).__name__}: {exc}"
+                backend.end(time.perf_counter() - started, failed=True, error=error)
+                backend.connect_failures += 1
+                backend.mark_down(error)
+                if len(tried) == len(self.backends):
+                    raise
+                self.failovers += 1
+                metrics.count("lm_failover")
+                logger.warning(f"LM request to {backend.url} failed to connect, retrying on another backend")
+            except BaseException as exc:
+                backend.end(time.perf_counter() - started, failed=True, error=f"{type(exc).__name__}: {exc}")
+                raise
+
+        failed = response.status_code >= 500
+        error = f"HTTP {response.status_code}" if failed else None
+        try:
+            yield response
+        except BaseException as exc:
+            failed = True
+            error = f"{type(exc).__name__}: {exc}"
+            raise
+        finally:
+            await response.aclose()
+            backend.end(time.perf_counter() - started, failed=failed, error=error)
+
+    async def post(
+        self, path: str, session_id: Optional[str] = None, pin_slot: bool = False, **kwargs
+    ) -> httpx.Response:
+        """
+        Send a POST request and read the whole response body.
+        See `stream()` for the arguments.
+        """
+        async with self.stream("POST", path, session_id=session_id, pin_slot=pin_slot, **kwargs) as response:
+            await response.aread()
+            return response
+
+    # ----------------------------------------
+    # Health checks
+    # ----------------------------------------
+
+    async def check(self, backend: LMBackend):
+        try:
+            res = await backend.client.get(self.health_path, timeout=self.health_timeout)
+            res.raise_for_status()
+        except Exception as exc:
+            backend.mark_down(f"Health check failed: {type(exc).__name__}: {exc}")
+        else:
+            if not backend.healthy:
+                logger.info(f"LM backend {backend.url} is healthy again")
+            backend.healthy = True
+            if backend.slots is None:
+                await self.discover_slots(backend)
+        backend.last_check = time.monotonic()
+
+    async def discover_slots(self, backend: LMBackend):
+        """
+        Read the number of parallel slots from llama.cpp's `/props` (`total_slots`).
+        Servers without it (e.g. LM Studio) get one slot; unreachable servers are asked
+        again after their next successful health check.
+        """
+        try:
+            res = await backend.client.get("/props", timeout=self.health_timeout)
+        except httpx.HTTPError as exc:
+            logger.warning(f"Could not read the slot count of LM backend {backend.url}: {type(exc).__name__}: {exc}")
+            return
+        try:
+            res.raise_for_status()
+            backend.slots = max(1, int(res.json()["total_slots"]))
+        except (httpx.HTTPStatusError, ValueError, KeyError, TypeError):
+            logger.info(f"LM backend {backend.url} reports no slot count, using 1 slot")
+            backend.slots = 1
+
+    async def check_all(self):
+        await asyncio.gather(*(self.check(backend) for backend in self.backends))
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.check_all()
+            except Exception as exc:
+                logger.error(f"LM health checks failed: {exc}")
+
+    async def start(self):
+        """
+        Probe every backend once, then keep probing them in the background.
+        """
+        await self.check_all()
+        healthy = [b.url for b in self.backends if b.healthy]
+        logger.info(f"LM backends: {len(healthy)}/{len(self.backends)} healthy {healthy}")
+        if self.health_interval > 0 and self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        await asyncio.gather(*(backend.client.aclose() for backend in self.backends))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backends": [backend.stats() for backend in self.backends],
+            "healthy": sum(backend.healthy for backend in self.backends),
+            "failovers": self.failovers,
+        }
@@ -0,0 +1,202 @@
+"""
+Shared Prometheus instrumentation for the Livie services.
+
+Usage:
+
+    from common import metrics
+
+    metrics.instrument(app, "server")          # /metrics endpoint + per-route latency
+    with metrics.upstream_timer("ai"):          # latency of a call to another service
+        ...
+    metrics.track_queue("story_pool", fn)       # gauge read from fn() on every scrape
+    metrics.count("story_pool_hit")             # named event counter
+
+Upstream timings recorded while handling a request are also returned to the caller in a
+`Server-Timing` response header, so the gateway's responses show where the time went.
+"""
+import time
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Match
+
+# Buckets cover fast lookups (ms) up to full LM generations and TTS synthesis (minutes)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling an HTTP request, per route.",
+    ["service", "method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being handled.",
+    ["service", "route"],
+)
+UPSTREAM_LATENCY = Histogram(
+    "upstream_request_duration_seconds",
+    "Time spent in calls to upstream dependencies (LM Studio, Postgres, other services).",
+    ["service", "target", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_IN_FLIGHT = Gauge(
+    "upstream_requests_in_flight",
+    "Calls to upstream dependencies currently in progress.",
+    ["service", "target"],
+)
+QUEUE_DEPTH = Gauge(
+    "queue_depth",
+    "Number of items waiting in an internal queue or pool.",
+    ["service", "queue"],
+)
+EVENTS = Counter(
+    "service_events_total",
+    "Named service events such as cache hits or coalesced requests.",
+    ["service", "event"],
+)
+
+_service = "unknown"
+
+# Upstream timings of the request being handled, for the Server-Timing header
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def count(event: str, amount: float = 1):
+    EVENTS.labels(_service, event).inc(amount)
+
+
+def track_queue(queue: str, depth: Callable[[], float]):
+    """
+    Report the depth of a queue or pool, read from `depth()` whenever metrics are scraped.
+    """
+    QUEUE_DEPTH.labels(_service, queue).set_function(depth)
+
+
+def record_upstream(target: str, seconds: float, outcome: str = "ok"):
+    UPSTREAM_LATENCY.labels(_service, target, outcome).observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((target, seconds))
+
+
+def record_upstream_server_timing(target: str, header: str):
+    """
+    Add the `Server-Timing` entries returned by an upstream to the current request's header,
+    prefixed with the target name (e.g. `ai.lm_studio`), so time is attributed across hops.
+    Not recorded in the histograms, since the upstream records them itself.
+    """
+    timings = _request_timings.get()
+    if timings is None or not header:
+        return
+    for entry in header.split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name and name != "total":
+                try:
+                    timings.append((f"{target}.{name}", float(value) / 1000))
+                except ValueError:
+                    pass
+
+
+@contextmanager
+def upstream_timer(target: str):
+    """
+    Time a call to an upstream dependency. The call counts as an error if the block raises.
+    """
+    in_flight = UPSTREAM_IN_FLIGHT.labels(_service, target)
+    in_flight.inc()
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        in_flight.dec()
+        record_upstream(target, time.perf_counter() - started, outcome)
+
+
+def server_timing_header(timings: List[Tuple[str, float]], total: float) -> str:
+    """
+    Format upstream timings as a `Server-Timing` header, summing repeated calls to one target.
+    """
+    per_target: Dict[str, float] = {}
+    for target, seconds in timings:
+        per_target[target] = per_target.get(target, 0.0) + seconds
+    entries = [f"{target};dur={seconds * 1000:.1f}" for target, seconds in per_target.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording per-route latency and in-flight requests, and adding the
+    `Server-Timing` header. Written as plain ASGI so streaming responses are not buffered.
+    """
+
+    def __init__(self, app, routes_app):
+        self.app = app
+        self.routes_app = routes_app
+
+    def _route(self, scope) -> str:
+        # Label by route template (e.g. /memory/{memory_id}) to keep label cardinality bounded
+        for route in self.routes_app.router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            await self.app(scope, receive, send)
+            return
+
+        route = self._route(scope)
+        timings: List[Tuple[str, float]] = []
+        token = _request_timings.set(timings)
+        in_flight = REQUESTS_IN_FLIGHT.labels(_service, route)
+        in_flight.inc()
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                header = server_timing_header(timings, time.perf_counter() - started)
+                message = {**message, "headers": [*message.get("headers", []), (b"server-timing", header.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            in_flight.dec()
+            REQUEST_LATENCY.labels(_service, scope["method"], route, str(status)).observe(
+                time.perf_counter() - started
+            )
+            _request_timings.reset(token)
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+def instrument(app, service: str):
+    """
+    Add request instrumentation and a Prometheus `/metrics` endpoint to a FastAPI app.
+
+    Args:
+    - app (FastAPI): The application to instrument.
+    - service (str): Value of the `service` label on every metric recorded by this process.
+    """
+    global _service
+    _service = service
+    app.add_middleware(MetricsMiddleware, routes_app=app)
+    app.add_route("/metrics", metrics_endpoint, include_in_schema=False)
@@ -10,16 +10,23 @@ export interface Memory {
     ai_enhanced_annotations?: any;
 }
 
+// A memory found by /memory/search, with its similarity to the query (1 is identical)
+export interface MemorySearchResult extends Memory {
+    similarity: number;
+}
+
 // Define the context interface with state and API methods
 interface MemoryContextType {
     memoryCount: number | null;
     memory: Memory | null;
     stories: Memory[];
+    searchResults: MemorySearchResult[];
     loading: boolean;
     getMemoryCount: () => Promise<void>;
     getMemory: (memoryId: number) => Promise<void>;
     annotateDiaryEntry: (diaryEntry: string, personalId: string) => Promise<void>;
     getAllStories: () => Promise<void>;
+    searchMemories: (query: string, k?: number) => Promise<void>;
 }
 
 // Create the context with undefined as the default
@@ -33,6 +40,7 @@ export const MemoryProvider: React.FC<MemoryProviderProps> = ({ children }) => {
     const [memoryCount, setMemoryCount] = useState<number | null>(null);
     const [memory, setMemory] = useState<Memory | null>(null);
     const [stories, setStories] = useState<Memory[]>([]);
+    const [searchResults, setSearchResults] = useState<MemorySearchResult[]>([]);
     const [loading, setLoading] = useState<boolean>(false);
 
     // Use an environment variable or fallback URL
@@ -88,6 +96,23 @@ export const MemoryProvider: React.FC<MemoryProviderProps> = ({ children }) => {
         }
     }, [baseUrl]);
 
+    const searchMemories = useCallback(async (query: string, k: number = 5): Promise<void> => {
+        try {
+            setLoading(true);
+            const params = new URLSearchParams({ q: query, k: String(k) });
+            const response = await fetch(`${baseUrl}/memory/search?${params}`);
+            if (!response.ok) {
+                throw new Error("Failed to search memories");
+            }
+            const data = await response.json();
+            setSearchResults(data.results);
+        } catch (error) {
+            console.error("Error in searchMemories:", error);
+        } finally {
+            setLoading(false);
+        }
+    }, [baseUrl]);
+
     const annotateDiaryEntry = useCallback(async (diaryEntry: string, personalId: string): Promise<void> => {
         try {
             setLoading(true);
@@ -104,7 +129,23 @@ export const MemoryProvider: React.FC<MemoryProviderProps> = ({ children }) => {
             if (!response.ok) {
                 throw new Error("Failed to annotate diary entry");
             }
-            await response.json();
+            // The entry is queued; wait until a worker has stored it as a story
+            const job = await response.json();
+            await new Promise<void>((resolve, reject) => {
+                const events = new EventSource(`${baseUrl}${job.events_url}`);
+                events.addEventListener("done", () => {
+                    events.close();
+                    resolve();
+                });
+                events.addEventListener("failed", (event) => {
+                    events.close();
+                    reject(new Error(`Annotation failed: ${JSON.parse((event as MessageEvent).data).error}`));
+                });
+                events.onerror = () => {
+                    events.close();
+                    reject(new Error("Lost the annotation progress stream"));
+                };
+            });
         } catch (error) {
             console.error("Error in annotateDiaryEntry:", error);
         } finally {
@@ -118,11 +159,13 @@ export const MemoryProvider: React.FC<MemoryProviderProps> = ({ children }) => {
                 memoryCount,
                 memory,
                 stories,
+                searchResults,
                 loading,
                 getMemoryCount,
                 getMemory,
                 annotateDiaryEntry,
                 getAllStories,
+                searchMemories,
             }}
         >
             {children}
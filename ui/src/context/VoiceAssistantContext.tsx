@@ -21,7 +21,7 @@ export interface VoiceAssistantContextType {
     loading: boolean;
     error: Error | null;
     analyzeInteraction: () => Promise<AnalyzeInteractionResponse>;
-    getStory: () => Promise<StoryResponse>;
+    getStory: (query?: string) => Promise<StoryResponse>;
     getChat: (latestMsg: string, prevMsgs: string[]) => Promise<ChatResponse>;
     getVoice: (
         voiceType: string,
@@ -61,11 +61,13 @@ export const VoiceAssistantProvider: React.FC<VoiceAssistantProviderProps> = ({
         }
     };
 
-    const getStory = async (): Promise<StoryResponse> => {
+    const getStory = async (query?: string): Promise<StoryResponse> => {
         setLoading(true);
         setError(null);
         try {
-            const response = await fetch('http://localhost:8000/story');
+            // With a query, the story is told from a memory relevant to it rather than a random one
+            const params = query ? `?${new URLSearchParams({ query })}` : '';
+            const response = await fetch(`http://localhost:8000/story${params}`);
             if (!response.ok) {
                 throw new Error('Error fetching story');
             }
@@ -128,7 +128,8 @@ export default function VoiceAssistant() {
                 const chatResponse = await getChat(userMessage, previousMsgs);
                 responseText = chatResponse.response;
             } else if (mode === "story") {
-                const storyResponse = await getStory();
+                // Tell a memory related to what was just said
+                const storyResponse = await getStory(userMessage);
                 // Check both keys: "enhanced_story" or "story"
                 responseText = storyResponse.enhanced_story || storyResponse.story;
                 console.log("Story response received:", storyResponse);